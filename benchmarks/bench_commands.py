@@ -0,0 +1,337 @@
+"""Synthetic load test for the slash commands.
+
+Drives the real command callbacks (/getcredit, /redeem, the bulk redeem modal,
+/getugphone, /hcoin_top and /list) with fake Interaction objects at a fixed
+concurrency. It runs against a temporary SQLite database seeded at each size
+and a local fake shortener. Prints one JSON object per (size, command) with
+throughput, latency percentiles, event-loop lag and reply outcomes.
+
+    python benchmarks/bench_commands.py --sizes 1000 100000 --concurrency 50 --requests 500
+    python benchmarks/bench_commands.py --output after.json --baseline before.json
+
+Discord itself is replaced by in-process fakes. fetch_user sleeps for
+--fetch-user-latency-ms instead of calling the REST API, and DMs and followups
+are recorded rather than sent.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_shortener import start_in_thread  # noqa: E402
+
+COMMANDS = ['getcredit', 'redeem', 'redeem_modal', 'getugphone', 'hcoin_top', 'list_localstorage', 'list_code']
+CODES_PER_MODAL = 5
+
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        return self
+
+
+class FakeDMChannel:
+    async def send(self, *args, **kwargs):
+        return FakeMessage()
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = self.display_name = f"bench-user-{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.display_avatar = SimpleNamespace(url='https://cdn.discordapp.com/embed/avatars/0.png')
+
+    async def create_dm(self):
+        return FakeDMChannel()
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self._interaction.record(content, kwargs.get('embed'))
+
+    async def send_modal(self, modal):
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self._interaction.record(None, kwargs.get('embed'))
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self._interaction.record(content, kwargs.get('embed'))
+        return FakeMessage()
+
+
+class FakeInteraction:
+    def __init__(self, command_name, user_id, channel_id=1):
+        self.user = FakeUser(user_id)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.channel_id = channel_id
+        self.channel = SimpleNamespace(id=channel_id, name='bench')
+        self.guild = None
+        self.command = SimpleNamespace(name=command_name, qualified_name=command_name)
+        self.command_failed = False
+        self.data = {'name': command_name}
+        self.outcome = None
+
+    def record(self, content, embed):
+        if self.outcome is None:
+            self.outcome = embed.title if embed is not None and embed.title else (content or '')[:60]
+
+    async def edit_original_response(self, **kwargs):
+        self.record(None, kwargs.get('embed'))
+        return FakeMessage()
+
+
+def random_code(rng):
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+async def seed(bot, start, stop, rng):
+    """Grow every table from `start` to `stop` rows and return the new redemption codes."""
+    count = stop - start
+    codes = [random_code(rng) for _ in range(count)]
+    phones = []
+    for i in range(start, stop):
+        data_json = json.dumps({"id": i, "token": rng.randbytes(48).hex()})
+        phones.append((data_json, bot.ug_phone_content_hash(data_json)))
+
+    def write(conn):
+        conn.executemany("INSERT OR IGNORE INTO redemption_codes (code) VALUES (?)", ((code,) for code in codes))
+        conn.executemany("INSERT OR IGNORE INTO ug_phones (data_json, content_hash) VALUES (?, ?)", phones)
+        conn.executemany(
+            "INSERT INTO user_balances (user_id, hcoin_balance) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET hcoin_balance = excluded.hcoin_balance",
+            ((10_000 + i, rng.randrange(0, 200) * bot.HCOIN_PER_CODE) for i in range(start, stop))
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO hcoin_pastebin_links (pastebin_url) VALUES (?)",
+            ((f"https://pastebin.com/bench{i}",) for i in range(start, stop))
+        )
+
+    await bot.db.run_write(write)
+    return codes
+
+
+async def measure_loop_lag(samples, stop_event, interval=0.005):
+    while not stop_event.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run_command(bot, command, make_call, requests, concurrency, user_ids):
+    latencies = []
+    outcomes = Counter()
+    errors = Counter()
+    lag_samples = []
+    next_index = iter(range(requests))
+    stop_event = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples, stop_event))
+
+    async def worker():
+        for i in next_index:
+            interaction = FakeInteraction(command, user_ids[i % len(user_ids)])
+            started = time.perf_counter()
+            try:
+                await make_call(interaction, i)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+            outcomes[interaction.outcome or 'no reply'] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop_event.set()
+    await lag_task
+
+    latencies.sort()
+    lag_samples.sort()
+    return {
+        'command': command,
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'loop_lag_p99_ms': round(percentile(lag_samples, 0.99) * 1000, 3),
+        'loop_lag_max_ms': round(lag_samples[-1] * 1000, 3) if lag_samples else 0.0,
+        'outcomes': dict(outcomes),
+        'errors': dict(errors),
+    }
+
+
+def build_calls(bot, app_commands, codes, user_count):
+    code_iter = iter(codes)
+
+    def take_codes(n):
+        return [next(code_iter, random_code(random)) for _ in range(n)]
+
+    async def redeem_modal(interaction, i):
+        modal = bot.RedeemMultipleCodesModal()
+        modal.codes_input._value = "\n".join(take_codes(CODES_PER_MODAL))
+        await modal.on_submit(interaction)
+
+    top_pages = max(1, user_count // bot.HCOIN_TOP_PAGE_SIZE)
+    return {
+        'getcredit': lambda interaction, i: bot.get_credit.callback(interaction),
+        'redeem': lambda interaction, i: bot.redeem_code.callback(interaction, take_codes(1)[0]),
+        'redeem_modal': redeem_modal,
+        'getugphone': lambda interaction, i: bot.get_ug_phone_command.callback(interaction),
+        'hcoin_top': lambda interaction, i: bot.hcoin_top.callback(interaction, random.randint(1, top_pages)),
+        'list_localstorage': lambda interaction, i: bot.list_items.callback(interaction, app_commands.Choice(name='Local Storage', value='localstorage')),
+        'list_code': lambda interaction, i: bot.list_items.callback(interaction, app_commands.Choice(name='Codes', value='code')),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(row['size'], row['command']): row for row in json.load(f)['results']}
+    for row in results:
+        before = baseline.get((row['size'], row['command']))
+        if before is None:
+            continue
+        print(json.dumps({
+            'size': row['size'],
+            'command': row['command'],
+            'throughput_ratio': round(row['throughput_rps'] / before['throughput_rps'], 3) if before['throughput_rps'] else None,
+            'p99_ratio': round(row['p99_ms'] / before['p99_ms'], 3) if before['p99_ms'] else None,
+            'loop_lag_p99_delta_ms': round(row['loop_lag_p99_ms'] - before['loop_lag_p99_ms'], 3),
+        }))
+
+
+async def start_environment(bot, args):
+    """Point the bot at the fake shortener and a fake fetch_user, migrate the
+    database and start the credit pool. Returns the shortener server."""
+    logging.getLogger('discord_bot').setLevel(args.log_level)
+    server, api_url = start_in_thread(latency_ms=args.shortener_latency_ms, error_rate=args.shortener_error_rate)
+    bot.shortener.api_url = api_url
+    bot.shortener.token = 'bench'
+
+    async def fake_fetch_user(user_id):
+        await asyncio.sleep(args.fetch_user_latency_ms / 1000)
+        return FakeUser(user_id)
+
+    bot.bot.fetch_user = fake_fetch_user
+    if not args.admission:
+        for lane in bot.admission.lanes.values():
+            lane.rate = lane.burst = 1e9
+            lane.tokens = float(lane.burst)
+
+    await bot.db.run_write(bot.migrate_db)
+    if args.credit_pool:
+        bot.credit_pool.start()
+    return server
+
+
+async def stop_environment(bot, server):
+    await bot.credit_pool.stop()
+    await bot.user_names.stop()
+    await bot.shortener.close()
+    server.shutdown()
+
+
+def add_environment_arguments(parser, admission_default=False):
+    parser.add_argument('--shortener-latency-ms', type=float, default=50.0)
+    parser.add_argument('--shortener-error-rate', type=float, default=0.0)
+    parser.add_argument('--fetch-user-latency-ms', type=float, default=50.0)
+    parser.add_argument('--admission', action=argparse.BooleanOptionalAction, default=admission_default,
+                        help='keep the configured admission limits (off lifts them to measure raw capacity)')
+    parser.add_argument('--credit-pool', action=argparse.BooleanOptionalAction, default=True, help='run the pre-minted /getcredit link pool')
+    parser.add_argument('--log-level', default='ERROR', help='log level for the bot while the benchmark runs')
+
+
+async def run(args):
+    import bot
+    from discord import app_commands
+
+    server = await start_environment(bot, args)
+    rng = random.Random(args.seed)
+    commands = args.commands or COMMANDS
+    results = []
+    codes = []
+    seeded = 0
+    try:
+        for size in sorted(args.sizes):
+            codes.extend(await seed(bot, seeded, size, rng))
+            seeded = size
+            rng.shuffle(codes)
+            calls = build_calls(bot, app_commands, codes, size)
+            user_ids = [10_000 + rng.randrange(size) for _ in range(max(1, args.users))]
+            for command in commands:
+                row = await run_command(bot, command, calls[command], args.requests, args.concurrency, user_ids)
+                row['size'] = size
+                results.append(row)
+                print(json.dumps(row, ensure_ascii=False), flush=True)
+            remaining = {row[0] for row in await bot.db.fetchall("SELECT code FROM redemption_codes")}
+            codes = [code for code in codes if code in remaining]
+    finally:
+        await stop_environment(bot, server)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--commands', nargs='+', choices=COMMANDS)
+    parser.add_argument('--requests', type=int, default=500, help='calls per command and size')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=200, help='distinct users issuing commands')
+    add_environment_arguments(parser)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write all results as a JSON document')
+    parser.add_argument('--baseline', help='JSON document from a previous --output run to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_FILE'] = os.path.join(tmp, 'bench.db')
+        os.environ.setdefault('METRICS_PORT', '0')
+        results = asyncio.run(run(args))
+        import bot
+        bot.db.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Random Local Storage pick latency versus inventory size.
+
+Compares the slot-index pick used by /getugphone with the old
+ORDER BY RANDOM() query on a temporary database grown from 1k to 1M rows.
+
+    python benchmarks/bench_random_pick.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_FILE', os.path.join(tempfile.gettempdir(), 'bench_bot_import.db'))
+import bot  # noqa: E402
+
+LEGACY_PICK_SQL = "SELECT id, data_json FROM ug_phones ORDER BY RANDOM() LIMIT 1"
+
+
+def seed(conn, start, stop, payload_bytes):
+    filler = 'x' * payload_bytes
+    conn.executemany(
+        "INSERT INTO ug_phones (data_json) VALUES (?)",
+        ((json.dumps({"id": i, "token": filler}),) for i in range(start, stop))
+    )
+    conn.commit()
+
+
+def time_query(conn, sql, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        conn.execute(sql).fetchone()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 4),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--legacy-iterations', type=int, default=20, help='ORDER BY RANDOM() samples per size (0 to skip)')
+    parser.add_argument('--payload-bytes', type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute("PRAGMA journal_mode=WAL")
+        bot.migrate_db(conn)
+        conn.commit()
+        results = []
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed(conn, seeded, size, args.payload_bytes)
+            seeded = size
+            row = {'rows': size, 'slot_index': time_query(conn, bot.PICK_RANDOM_UG_PHONE_SQL, args.iterations)}
+            if args.legacy_iterations:
+                row['order_by_random'] = time_query(conn, LEGACY_PICK_SQL, args.legacy_iterations)
+            results.append(row)
+            print(json.dumps(row), flush=True)
+        conn.close()
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""SQL microbenchmarks for the bot's database paths versus table size and PRAGMA profile.
+
+Runs the SQL helpers from bot.py directly on a raw SQLite connection, without the
+event loop, the writer thread or Discord. Each size is seeded once into a
+template database, and each journal_mode/synchronous profile runs on its own copy
+of that template. Prints one JSON object per (size, profile, operation) with
+ops/s, latency percentiles and the database and WAL file sizes.
+
+    python benchmarks/bench_sql.py --sizes 10000 100000 1000000 10000000
+    python benchmarks/bench_sql.py --sizes 100000 --profiles wal:normal wal:full delete:full --ops redeem_hit hcoin_upsert
+
+Operations:
+  redeem_hit / redeem_miss   claim_redemption_codes for an existing / unknown code
+  hcoin_upsert               credit_user_hcoin (ledger insert + balance upsert + rank histogram triggers)
+  hcoin_top_page             read_hcoin_top_page at a random offset
+  user_rank                  read_user_rank for a random user
+  ug_phone_pick              PICK_RANDOM_UG_PHONE_SQL
+  list_code / list_link / list_localstorage
+                             read_list_page jumping to a random key
+  dedupe                     deduplicate_ug_phones_data over --dedupe-rows unhashed rows, half duplicates
+                             (ops/s is rows checked per second)
+
+Write operations commit every --ops-per-commit operations. The default of 1 is
+the worst case; the bot's writer thread groups concurrent writes into one commit.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_FILE', os.path.join(tempfile.gettempdir(), 'bench_bot_import.db'))
+import bot  # noqa: E402
+
+DEFAULT_PROFILES = ['wal:normal', 'wal:full', 'wal:off', 'delete:full', 'delete:normal']
+OPERATIONS = [
+    'redeem_hit', 'redeem_miss', 'hcoin_upsert', 'hcoin_top_page', 'user_rank', 'ug_phone_pick',
+    'list_code', 'list_link', 'list_localstorage', 'dedupe',
+]
+WRITE_OPERATIONS = {'redeem_hit', 'redeem_miss', 'hcoin_upsert'}
+SEED_CHUNK = 100_000
+USER_ID_BASE = 10_000
+
+
+def random_code(rng):
+    return f"{rng.getrandbits(40):010X}"
+
+
+def phone_json(i, rng, payload_bytes):
+    return json.dumps({"id": i, "token": rng.randbytes(payload_bytes // 2).hex()})
+
+
+def chunks(start, stop):
+    for chunk_start in range(start, stop, SEED_CHUNK):
+        yield chunk_start, min(stop, chunk_start + SEED_CHUNK)
+
+
+def seed(conn, start, stop, rng, payload_bytes):
+    """Grow redemption_codes, user_balances, ug_phones and hcoin_pastebin_links from `start` to `stop` rows."""
+    for lo, hi in chunks(start, stop):
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO redemption_codes (code) VALUES (?)", ((random_code(rng),) for _ in range(lo, hi)))
+        conn.executemany(
+            "INSERT INTO user_balances (user_id, hcoin_balance) VALUES (?, ?)",
+            ((USER_ID_BASE + i, rng.randrange(0, 200) * bot.HCOIN_PER_CODE) for i in range(lo, hi))
+        )
+        phones = [phone_json(i, rng, payload_bytes) for i in range(lo, hi)]
+        conn.executemany(
+            "INSERT OR IGNORE INTO ug_phones (data_json, content_hash) VALUES (?, ?)",
+            ((data_json, bot.ug_phone_content_hash(data_json)) for data_json in phones)
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO hcoin_pastebin_links (pastebin_url) VALUES (?)",
+            ((f"https://pastebin.com/bench{i}",) for i in range(lo, hi))
+        )
+        conn.execute("COMMIT")
+
+
+def file_sizes(path):
+    wal = path + '-wal'
+    return os.path.getsize(path), os.path.getsize(wal) if os.path.exists(wal) else 0
+
+
+def open_profile(path, profile):
+    journal_mode, synchronous = profile.split(':')
+    conn = sqlite3.connect(path, isolation_level=None)
+    actual = conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+    if actual.lower() != journal_mode.lower():
+        raise ValueError(f"journal_mode={journal_mode} not supported here (got {actual})")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+
+class Workload:
+    def __init__(self, conn, size, rng, args):
+        self.conn = conn
+        self.size = size
+        self.rng = rng
+        self.args = args
+
+    def random_user(self):
+        return USER_ID_BASE + self.rng.randrange(self.size)
+
+    def sample_codes(self, count):
+        """Pick existing codes outside the timed loop."""
+        codes = set()
+        attempts = 0
+        while len(codes) < count and attempts < count * 4:
+            attempts += 1
+            row = self.conn.execute(
+                "SELECT code FROM redemption_codes WHERE code >= ? ORDER BY code LIMIT 1", (random_code(self.rng),)
+            ).fetchone()
+            if row:
+                codes.add(row[0])
+        return list(codes)
+
+    def prepare(self, operation, iterations):
+        """Return a callable(i) running one operation."""
+        conn, rng = self.conn, self.rng
+        if operation == 'redeem_hit':
+            codes = self.sample_codes(iterations)
+            return lambda i: bot.claim_redemption_codes(conn, self.random_user(), [codes[i % len(codes)]])
+        if operation == 'redeem_miss':
+            return lambda i: bot.claim_redemption_codes(conn, self.random_user(), [f"MISS{rng.getrandbits(24):06X}"])
+        if operation == 'hcoin_upsert':
+            return lambda i: bot.credit_user_hcoin(conn, self.random_user(), bot.HCOIN_PER_CODE, 'bench')
+        if operation == 'hcoin_top_page':
+            page_size = bot.HCOIN_TOP_PAGE_SIZE
+            return lambda i: bot.read_hcoin_top_page(conn, rng.randrange(max(1, self.size // page_size)) * page_size, page_size)
+        if operation == 'user_rank':
+            return lambda i: bot.read_user_rank(conn, self.random_user())
+        if operation == 'ug_phone_pick':
+            return lambda i: conn.execute(bot.PICK_RANDOM_UG_PHONE_SQL).fetchone()
+        if operation.startswith('list_'):
+            source = bot.LIST_SOURCES[operation[len('list_'):]]
+            if source['key_type'] is int:
+                return lambda i: bot.read_list_page(conn, source, 'jump', rng.randrange(1, self.size + 1))
+            return lambda i: bot.read_list_page(conn, source, 'jump', random_code(rng))
+        raise ValueError(operation)
+
+    def run(self, operation):
+        if operation == 'dedupe':
+            return self.run_dedupe()
+        iterations = self.args.iterations if operation not in WRITE_OPERATIONS else self.args.write_iterations
+        call = self.prepare(operation, iterations)
+        is_write = operation in WRITE_OPERATIONS
+        per_commit = max(1, self.args.ops_per_commit)
+        samples = []
+        deadline = time.perf_counter() + self.args.max_seconds
+        started = time.perf_counter()
+        for i in range(iterations):
+            op_started = time.perf_counter()
+            if is_write and i % per_commit == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            call(i)
+            if is_write and (i % per_commit == per_commit - 1 or i == iterations - 1):
+                self.conn.execute("COMMIT")
+            samples.append(time.perf_counter() - op_started)
+            if op_started > deadline:
+                if is_write and self.conn.in_transaction:
+                    self.conn.execute("COMMIT")
+                break
+        elapsed = time.perf_counter() - started
+        return summarize(samples, len(samples), elapsed)
+
+    def run_dedupe(self):
+        rows = self.args.dedupe_rows
+        rng = self.rng
+        existing = self.conn.execute(
+            "SELECT data_json FROM ug_phones WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([rng.randrange(1, self.size + 1) for _ in range(rows // 2)]),)
+        ).fetchall()
+        # Duplicates with reordered keys plus fresh rows, all without a content hash
+        pending = [json.dumps(dict(reversed(list(json.loads(row[0]).items())))) for row in existing]
+        pending += [phone_json(self.size + i, rng, self.args.payload_bytes) for i in range(rows - len(pending))]
+        self.conn.execute("BEGIN")
+        self.conn.executemany("INSERT INTO ug_phones (data_json) VALUES (?)", ((data_json,) for data_json in pending))
+        self.conn.execute("COMMIT")
+        started = time.perf_counter()
+        self.conn.execute("BEGIN IMMEDIATE")
+        bot.deduplicate_ug_phones_data(self.conn)
+        self.conn.execute("COMMIT")
+        elapsed = time.perf_counter() - started
+        return summarize([elapsed], len(pending), elapsed)
+
+
+def summarize(samples, operations, elapsed):
+    samples.sort()
+    return {
+        'operations': operations,
+        'ops_per_s': round(operations / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(samples) * 1000, 4),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--profiles', nargs='+', default=DEFAULT_PROFILES, help='journal_mode:synchronous pairs')
+    parser.add_argument('--ops', nargs='+', choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument('--iterations', type=int, default=2000, help='samples per read operation')
+    parser.add_argument('--write-iterations', type=int, default=500, help='samples per write operation')
+    parser.add_argument('--ops-per-commit', type=int, default=1)
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='stop an operation early after this long')
+    parser.add_argument('--dedupe-rows', type=int, default=2000)
+    parser.add_argument('--payload-bytes', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dir', help='directory for the benchmark databases (default: a temporary directory)')
+    parser.add_argument('--output', help='write all results as a JSON document')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        template_path = os.path.join(tmp, 'template.db')
+        template = sqlite3.connect(template_path, isolation_level=None)
+        template.execute("PRAGMA journal_mode=WAL")
+        template.execute("PRAGMA synchronous=OFF")
+        bot.migrate_db(template)
+        seeded = 0
+        for size in sorted(args.sizes):
+            seed_started = time.perf_counter()
+            seed(template, seeded, size, rng, args.payload_bytes)
+            seeded = size
+            template.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            print(json.dumps({'size': size, 'seed_seconds': round(time.perf_counter() - seed_started, 1), 'template_bytes': file_sizes(template_path)[0]}), flush=True)
+            for profile in args.profiles:
+                path = os.path.join(tmp, f"{profile.replace(':', '_')}.db")
+                shutil.copyfile(template_path, path)
+                conn = open_profile(path, profile)
+                workload = Workload(conn, size, random.Random(rng.random()), args)
+                try:
+                    for operation in args.ops:
+                        row = {'size': size, 'profile': profile, 'operation': operation, **workload.run(operation)}
+                        row['db_bytes'], row['wal_bytes'] = file_sizes(path)
+                        results.append(row)
+                        print(json.dumps(row), flush=True)
+                finally:
+                    conn.close()
+                    for suffix in ('', '-wal', '-shm', '-journal'):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+        template.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Local stand-in for the Yeumoney shortener API.
+
+Point the bot at it with YEUMONEY_API_URL=http://127.0.0.1:<port>/QL_api.php.
+It can simulate latency, 5xx responses and malformed JSON.
+
+    python benchmarks/fake_shortener.py --port 8765 --latency-ms 150 --error-rate 0.1 --malformed-rate 0.05
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeShortenerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(random.uniform(server.latency * 0.5, server.latency * 1.5))
+        roll = random.random()
+        if roll < server.error_rate:
+            self._reply(503, b'{"status":"error","message":"Service Unavailable"}')
+        elif roll < server.error_rate + server.malformed_rate:
+            self._reply(200, b'<html>not json</html>')
+        elif 'url' not in query:
+            self._reply(200, json.dumps({"status": "error", "message": "Missing url"}).encode())
+        else:
+            short_id = next(server.counter)
+            body = {"status": "success", "shortenedUrl": f"https://yeumoney.local/{short_id:x}"}
+            self._reply(200, json.dumps(body).encode())
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=0, latency_ms=0.0, error_rate=0.0, malformed_rate=0.0):
+    server = ThreadingHTTPServer((host, port), FakeShortenerHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000
+    server.error_rate = error_rate
+    server.malformed_rate = malformed_rate
+    server.counter = itertools.count(1)
+    server.lock = threading.Lock()
+    server.requests = 0
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a server on a background thread and return (server, api_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-shortener', daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/QL_api.php"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency_ms, args.error_rate, args.malformed_rate)
+    print(f"Fake shortener listening on http://{args.host}:{server.server_address[1]}/QL_api.php")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
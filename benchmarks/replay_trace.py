@@ -0,0 +1,257 @@
+"""Replay a recorded interaction trace against the bot.
+
+The bot writes a trace when TRACE_FILE is set: one JSON line per slash command
+or bulk-redeem modal submit, holding the start time, command, sanitised options,
+a salted user bucket, the observed duration and the status. This script replays
+that trace through the real command callbacks. It uses the same fake Discord
+objects, temporary database and fake shortener as bench_commands.py, and
+reports per-command latency percentiles next to the ones recorded in production.
+
+    python benchmarks/replay_trace.py trace.jsonl --speed 1
+    python benchmarks/replay_trace.py trace.jsonl --speed 10 --output after.json
+    python benchmarks/replay_trace.py trace.jsonl --speed max --concurrency 100
+    python benchmarks/replay_trace.py --compare before.json after.json
+
+--speed 1 keeps the recorded inter-arrival times, --speed 10 compresses them
+tenfold, and --speed max issues requests as fast as --concurrency allows.
+Free-text options were reduced to their length when recorded. On replay the
+redeem `code` option is filled with a seeded code and any other text with a
+random string of that length. User buckets map to seeded user IDs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_commands import (  # noqa: E402
+    FakeInteraction, FakeUser, add_environment_arguments, measure_loop_lag, percentile,
+    random_code, seed, start_environment, stop_environment,
+)
+
+
+def load_trace(path):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry['ts'])
+    return entries
+
+
+def summarize(latencies_ms):
+    values = sorted(latencies_ms)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(statistics.median(values), 3),
+        'p95_ms': round(percentile(values, 0.95), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+
+def ks_statistic(a, b):
+    """Two-sample Kolmogorov-Smirnov statistic: the largest gap between the two empirical CDFs."""
+    a, b = sorted(a), sorted(b)
+    if not a or not b:
+        return None
+    i = j = 0
+    gap = 0.0
+    while i < len(a) and j < len(b):
+        value = min(a[i], b[j])
+        while i < len(a) and a[i] <= value:
+            i += 1
+        while j < len(b) and b[j] <= value:
+            j += 1
+        gap = max(gap, abs(i / len(a) - j / len(b)))
+    return round(gap, 4)
+
+
+class Replayer:
+    def __init__(self, bot, app_commands, codes, rng):
+        self.bot = bot
+        self.app_commands = app_commands
+        self.codes = iter(codes)
+        self.rng = rng
+
+    def take_code(self):
+        return next(self.codes, None) or random_code(self.rng)
+
+    def text(self, length):
+        return ''.join(self.rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=max(1, length)))
+
+    def build_kwargs(self, command, options):
+        params = {param.name: param for param in command.parameters}
+        kwargs = {}
+        for name, value in options.items():
+            param = params.get(name)
+            if param is None:
+                raise ValueError(f"unknown option {name!r}")
+            if isinstance(value, dict):
+                if 'len' in value:
+                    value = self.take_code() if name == 'code' else self.text(value['len'])
+                elif 'user' in value:
+                    value = FakeUser(10_000 + value['user'])
+                else:
+                    raise ValueError(f"option type {value.get('type')} cannot be replayed")
+            if param.choices:
+                choice = next((c for c in param.choices if c.value == value), None)
+                value = choice if choice is not None else self.app_commands.Choice(name=str(value), value=value)
+            kwargs[name] = value
+        return kwargs
+
+    async def call(self, entry, interaction):
+        if entry['command'] == 'redeem_modal':
+            modal = self.bot.RedeemMultipleCodesModal()
+            count = int(entry['options'].get('codes', 1))
+            modal.codes_input._value = "\n".join(self.take_code() for _ in range(count))
+            await modal.on_submit(interaction)
+            return
+        command = self.bot.bot.tree.get_command(entry['command'])
+        if command is None:
+            raise ValueError(f"unknown command {entry['command']!r}")
+        await command.callback(interaction, **self.build_kwargs(command, entry['options']))
+
+
+async def replay(args, entries):
+    import bot
+    from discord import app_commands
+
+    server = await start_environment(bot, args)
+    rng = random.Random(args.seed)
+    latencies = defaultdict(list)
+    outcomes = defaultdict(Counter)
+    errors = defaultdict(Counter)
+    lag_samples = []
+    stop_event = asyncio.Event()
+    try:
+        codes = await seed(bot, 0, args.size, rng)
+        rng.shuffle(codes)
+        replayer = Replayer(bot, app_commands, codes, rng)
+        lag_task = asyncio.create_task(measure_loop_lag(lag_samples, stop_event))
+
+        async def issue(entry):
+            interaction = FakeInteraction(entry['command'], 10_000 + entry['user'])
+            started = time.perf_counter()
+            try:
+                await replayer.call(entry, interaction)
+            except Exception as e:
+                errors[entry['command']][type(e).__name__] += 1
+            latencies[entry['command']].append((time.perf_counter() - started) * 1000)
+            outcomes[entry['command']][interaction.outcome or 'no reply'] += 1
+
+        started = time.perf_counter()
+        if args.speed == 'max':
+            pending = iter(entries)
+
+            async def worker():
+                for entry in pending:
+                    await issue(entry)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        else:
+            speed = float(args.speed)
+            origin = entries[0]['ts'] if entries else 0.0
+            tasks = []
+            for entry in entries:
+                delay = (entry['ts'] - origin) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(issue(entry)))
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop_event.set()
+        await lag_task
+    finally:
+        stop_event.set()
+        await stop_environment(bot, server)
+
+    recorded = defaultdict(list)
+    for entry in entries:
+        recorded[entry['command']].append(entry['duration_ms'])
+    lag_samples.sort()
+    commands = {}
+    for command in sorted(recorded):
+        commands[command] = {
+            'replayed': summarize(latencies[command]),
+            'recorded': summarize(recorded[command]),
+            'outcomes': dict(outcomes[command]),
+            'errors': dict(errors[command]),
+        }
+        print(json.dumps({'command': command, **commands[command]}, ensure_ascii=False), flush=True)
+    summary = {
+        'entries': len(entries),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(entries) / elapsed, 1) if elapsed else None,
+        'loop_lag_p99_ms': round(percentile(lag_samples, 0.99) * 1000, 3),
+        'loop_lag_max_ms': round(lag_samples[-1] * 1000, 3) if lag_samples else 0.0,
+    }
+    print(json.dumps(summary), flush=True)
+    return {'summary': summary, 'commands': commands, 'latencies_ms': {k: [round(v, 3) for v in vals] for k, vals in latencies.items()}}
+
+
+def compare(before_path, after_path):
+    with open(before_path, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_path, encoding='utf-8') as f:
+        after = json.load(f)
+    for command in sorted(set(before['commands']) & set(after['commands'])):
+        old = before['commands'][command]['replayed']
+        new = after['commands'][command]['replayed']
+        row = {'command': command}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            row[key.replace('_ms', '_ratio')] = round(new[key] / old[key], 3) if old.get(key) else None
+        row['ks'] = ks_statistic(before['latencies_ms'].get(command, []), after['latencies_ms'].get(command, []))
+        print(json.dumps(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', nargs='?', help='JSONL trace written by the bot (TRACE_FILE)')
+    parser.add_argument('--speed', default='1', help="replay speed multiplier, or 'max'")
+    parser.add_argument('--concurrency', type=int, default=50, help="concurrent requests with --speed max")
+    parser.add_argument('--size', type=int, default=10000, help='rows seeded into each table before replaying')
+    add_environment_arguments(parser, admission_default=True)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the replay results as a JSON document')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two --output documents instead of replaying')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.trace:
+        parser.error('a trace file is required unless --compare is given')
+    if args.speed != 'max':
+        try:
+            if float(args.speed) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error("--speed must be a positive number or 'max'")
+
+    entries = load_trace(args.trace)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_FILE'] = os.path.join(tmp, 'replay.db')
+        os.environ.setdefault('METRICS_PORT', '0')
+        os.environ.pop('TRACE_FILE', None)
+        result = asyncio.run(replay(args, entries))
+        import bot
+        bot.db.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), **result}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,30 +3,178 @@ from discord.ext import commands
 import os
 from discord import app_commands, ui
 from dotenv import load_dotenv
-import requests
+import aiohttp
 import json
 import sqlite3
 import random
 import asyncio
 import string
+import time
+import hashlib
+import gzip
+import io
+import itertools
+import csv
+import tempfile
+import zipfile
+import queue
+import sys
+import threading
+import traceback
+import weakref
+import concurrent.futures
+from pathlib import Path
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 import logging
-from tenacity import retry, stop_after_attempt, wait_fixed
+import logging.handlers
+import contextvars
+import atexit
+from aiohttp import web
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 logger = logging.getLogger('discord_bot')
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Logging: LOG_FORMAT is 'text' or 'json' (one JSON object per line), written to
+# LOG_FILE or stderr. Records logged with extra=LOG_SAMPLED (known spam such as
+# invalid codes and CheckFailure floods) are capped at LOG_SAMPLE_BURST per message
+# per LOG_SAMPLE_WINDOW seconds (LOG_SAMPLE_BURST=0 disables sampling).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_FILE = os.getenv('LOG_FILE', '')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_WINDOW = float(os.getenv('LOG_SAMPLE_WINDOW', '60'))
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', '10'))
+
+# (command, user_id) of the interaction being handled, attached to its log records
+log_context = contextvars.ContextVar('log_context', default=None)
+
+class LogContextFilter(logging.Filter):
+    def filter(self, record):
+        context = log_context.get()
+        if context is not None and not hasattr(record, 'command'):
+            record.command, record.user_id = context
+        return True
+
+# Opt-in marker for log calls that may be sampled
+LOG_SAMPLED = {'sampled': True}
+
+# Lets the first `burst` records of each sampled message template through per
+# window and drops the rest. The first one let through in the next window carries
+# the number that were suppressed. Messages are logged %-style, so the unformatted
+# template identifies "the same message". Records without LOG_SAMPLED always pass,
+# so diagnostics like slow-query and loop-stall reports are never dropped.
+class LogSampler(logging.Filter):
+    def __init__(self, window=LOG_SAMPLE_WINDOW, burst=LOG_SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.name, str(record.msg))
+        now = record.created
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._windows[key] = [now, 1, 0]
+            elif state[1] < self.burst:
+                state[1] += 1
+                return True
+            else:
+                state[2] += 1
+                self.suppressed_total += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+            if isinstance(record.args, tuple) and record.args:
+                record.msg = f"{record.msg} (%d similar suppressed)"
+                record.args = record.args + (suppressed,)
+            elif not record.args:
+                record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        return True
+
+# Hands records to the listener thread without formatting them, so the %-style
+# arguments are only rendered off the event loop. Drops records instead of
+# blocking when the queue is full.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonLinesFormatter(logging.Formatter):
+    FIELDS = ('command', 'user_id', 'latency_ms', 'status', 'suppressed')
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# Route every logger through one queue; a QueueListener thread does the formatting and I/O
+def setup_logging():
+    output = logging.FileHandler(LOG_FILE, encoding='utf-8') if LOG_FILE else logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        output.setFormatter(JsonLinesFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    if LOG_SAMPLE_BURST > 0:
+        handler.addFilter(log_sampler)
+    handler.addFilter(LogContextFilter())
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    listener = logging.handlers.QueueListener(handler.queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+    return handler
+
+log_sampler = LogSampler()
+log_handler = setup_logging()
+
 # Define Intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
 # Database file name
-DATABASE_FILE = 'bot_data.db'
+DATABASE_FILE = os.getenv('DATABASE_FILE', 'bot_data.db')
+
+# Number of read-only SQLite connections used for queries
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', '4'))
+
+# Group commit: writes arriving within this window (or up to this many ops) share one transaction
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv('DB_WRITE_BATCH_WINDOW_MS', '3'))
+DB_WRITE_BATCH_MAX_OPS = int(os.getenv('DB_WRITE_BATCH_MAX_OPS', '100'))
+
+# Number of user balances kept in the in-process write-through cache
+BALANCE_CACHE_SIZE = int(os.getenv('BALANCE_CACHE_SIZE', '10000'))
 
 # Specific channel ID for admin commands
 ALLOWED_ADMIN_CHANNEL_ID = 1383013260902531074
@@ -39,37 +187,582 @@ DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 YEUMONEY_API_TOKEN = os.getenv('YEUMONEY_API_TOKEN')
 TEST_GUILD_ID = os.getenv('TEST_GUILD_ID')
 
+# Yeumoney shortener endpoint (override to point at a local stand-in server)
+YEUMONEY_API_URL = os.getenv('YEUMONEY_API_URL', 'https://yeumoney.com/QL_api.php')
+
+# Shortener client: per-request timeout, concurrent requests, retries with jittered backoff and circuit breaker
+SHORTENER_TIMEOUT = float(os.getenv('SHORTENER_TIMEOUT', '10'))
+SHORTENER_MAX_CONCURRENCY = int(os.getenv('SHORTENER_MAX_CONCURRENCY', '8'))
+SHORTENER_MAX_ATTEMPTS = int(os.getenv('SHORTENER_MAX_ATTEMPTS', '3'))
+SHORTENER_BACKOFF_BASE = float(os.getenv('SHORTENER_BACKOFF_BASE', '0.5'))
+SHORTENER_BACKOFF_MAX = float(os.getenv('SHORTENER_BACKOFF_MAX', '8'))
+SHORTENER_BREAKER_THRESHOLD = int(os.getenv('SHORTENER_BREAKER_THRESHOLD', '5'))
+SHORTENER_BREAKER_COOLDOWN = float(os.getenv('SHORTENER_BREAKER_COOLDOWN', '30'))
+
 # Placeholder for web generator URL (replace with your actual URL)
 WEB_GENERATOR_BASE_URL = 'https://itsukinguyen.github.io/Website/?key='
 
-# Dictionary to store active multi-line input sessions for /quickaddug
+# Hcoin credited for each redeemed code
+HCOIN_PER_CODE = 150
+
+# Pre-minted /getcredit link pool: target size, refill threshold and parallel shortener calls
+CREDIT_POOL_SIZE = int(os.getenv('CREDIT_POOL_SIZE', '50'))
+CREDIT_POOL_LOW_WATER = int(os.getenv('CREDIT_POOL_LOW_WATER', '20'))
+CREDIT_POOL_REFILL_CONCURRENCY = int(os.getenv('CREDIT_POOL_REFILL_CONCURRENCY', '4'))
+CREDIT_POOL_REFILL_INTERVAL = float(os.getenv('CREDIT_POOL_REFILL_INTERVAL', '60'))
+
+# /getugphone leases: seconds before an unconfirmed claim is returned to stock, and sweep period
+UG_PHONE_LEASE_TTL = float(os.getenv('UG_PHONE_LEASE_TTL', '300'))
+UG_PHONE_LEASE_SWEEP_INTERVAL = float(os.getenv('UG_PHONE_LEASE_SWEEP_INTERVAL', '30'))
+
+# Admission control for expensive commands: global token-bucket rate (per second) and burst per
+# command, plus the fair queue's capacity and the longest wait before a request is shed
+ADMISSION_GETCREDIT_RATE = float(os.getenv('ADMISSION_GETCREDIT_RATE', '5'))
+ADMISSION_GETCREDIT_BURST = int(os.getenv('ADMISSION_GETCREDIT_BURST', '20'))
+ADMISSION_GETUGPHONE_RATE = float(os.getenv('ADMISSION_GETUGPHONE_RATE', '5'))
+ADMISSION_GETUGPHONE_BURST = int(os.getenv('ADMISSION_GETUGPHONE_BURST', '10'))
+ADMISSION_REDEEM_RATE = float(os.getenv('ADMISSION_REDEEM_RATE', '20'))
+ADMISSION_REDEEM_BURST = int(os.getenv('ADMISSION_REDEEM_BURST', '50'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '100'))
+ADMISSION_QUEUE_PER_USER = int(os.getenv('ADMISSION_QUEUE_PER_USER', '2'))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '10'))
+
+# Hcoin ledger: entries older than this many days are compacted into one snapshot row per user
+HCOIN_LEDGER_RETENTION_DAYS = float(os.getenv('HCOIN_LEDGER_RETENTION_DAYS', '90'))
+HCOIN_LEDGER_COMPACT_INTERVAL = float(os.getenv('HCOIN_LEDGER_COMPACT_INTERVAL', '3600'))
+HCOIN_LEDGER_COMPACT_BATCH = int(os.getenv('HCOIN_LEDGER_COMPACT_BATCH', '50000'))
+HCOIN_HISTORY_PAGE_SIZE = int(os.getenv('HCOIN_HISTORY_PAGE_SIZE', '15'))
+
+# /list pagination: characters of each Local Storage entry shown per page, and view lifetime in seconds
+LIST_PREVIEW_CHARS = int(os.getenv('LIST_PREVIEW_CHARS', '600'))
+LIST_VIEW_TIMEOUT = float(os.getenv('LIST_VIEW_TIMEOUT', '600'))
+
+# /export: rows read per batch and attachment size limit used outside guilds
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_DEFAULT_FILESIZE_LIMIT = 10 * 1024 * 1024
+
+# /importugphone: entries per insert transaction, read chunk size and progress update period (seconds)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '2000'))
+IMPORT_READ_CHUNK = 64 * 1024
+IMPORT_PROGRESS_INTERVAL = float(os.getenv('IMPORT_PROGRESS_INTERVAL', '2'))
+
+# Users per /hcoin_top page
+HCOIN_TOP_PAGE_SIZE = int(os.getenv('HCOIN_TOP_PAGE_SIZE', '10'))
+
+# Display-name cache for leaderboards: how long a stored name is fresh, and how many fetch_user calls may run at once
+USER_NAME_TTL = float(os.getenv('USER_NAME_TTL', str(24 * 3600)))
+USER_NAME_FETCH_CONCURRENCY = int(os.getenv('USER_NAME_FETCH_CONCURRENCY', '4'))
+
+# Per-statement SQL statistics; statements slower than SLOW_QUERY_MS are logged with their query plan
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS_ENABLED', '1') == '1'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+QUERY_STATS_MAX_STATEMENTS = int(os.getenv('QUERY_STATS_MAX_STATEMENTS', '500'))
+
+# Event-loop watchdog: heartbeat period, lag that counts as a stall, and how many stalls are kept
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.1'))
+LOOP_STALL_THRESHOLD_MS = float(os.getenv('LOOP_STALL_THRESHOLD_MS', '250'))
+LOOP_STALL_HISTORY = int(os.getenv('LOOP_STALL_HISTORY', '50'))
+
+# Interaction trace recording for offline replay (benchmarks/replay_trace.py). Empty TRACE_FILE disables it.
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+TRACE_USER_BUCKETS = int(os.getenv('TRACE_USER_BUCKETS', '1024'))
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', '2'))
+
+# Prometheus metrics endpoint (text format). Set METRICS_PORT=0 to disable it.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# /quickaddug sessions: idle TTL (seconds), per-session caps, and how long confirmations are batched
+QUICKADD_SESSION_TTL = float(os.getenv('QUICKADD_SESSION_TTL', '1800'))
+QUICKADD_MAX_ITEMS = int(os.getenv('QUICKADD_MAX_ITEMS', '5000'))
+QUICKADD_MAX_BYTES = int(os.getenv('QUICKADD_MAX_BYTES', str(20 * 1024 * 1024)))
+QUICKADD_ACK_DELAY = float(os.getenv('QUICKADD_ACK_DELAY', '2'))
+
+# Active /quickaddug sessions (user_id -> expires_at). The staged entries live in ug_phone_staging.
 quick_add_ug_sessions = {}
 
-# Database connection pool
+# Minimal in-process metrics in the Prometheus text format. Counters and
+# histograms are updated from the event loop and the DB threads, so each one
+# holds its own lock. Gauges are collected from the components at scrape time.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values)) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, (counts, count, total) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+COMMAND_LATENCY = Histogram('bot_command_duration_seconds', 'Slash command handling time.', ('command', 'status'))
+COMMAND_ERRORS = Counter('bot_command_errors_total', 'Slash command errors by category.', ('command', 'category'))
+DB_OPERATION_LATENCY = Histogram('bot_db_operation_seconds', 'Database operation time including queueing.', ('kind',))
+SHORTENER_LATENCY = Histogram('bot_shortener_call_seconds', 'Shortener call time including retries.', ('outcome',))
+EVENT_LOOP_LAG = Histogram('bot_event_loop_lag_seconds', 'How late the event loop ran the watchdog heartbeat.',
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+METRICS = [COMMAND_LATENCY, COMMAND_ERRORS, DB_OPERATION_LATENCY, SHORTENER_LATENCY, EVENT_LOOP_LAG]
+
+# Per-statement SQL statistics, keyed by whitespace-normalised SQL. A statement's
+# time covers execute() plus every fetch on its cursor, and is recorded when the
+# cursor moves on to another statement, is closed or is released. The first time
+# a statement runs slower than SLOW_QUERY_MS its EXPLAIN QUERY PLAN is captured
+# and kept for later slow-query log lines.
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, max_statements=QUERY_STATS_MAX_STATEMENTS):
+        self.slow_seconds = slow_ms / 1000
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, conn, sql, params, seconds, rows):
+        key = ' '.join(sql.split())
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_statements:
+                    return
+                entry = self._stats[key] = {'count': 0, 'seconds': 0.0, 'max': 0.0, 'rows': 0, 'slow': 0, 'samples': deque(maxlen=1000), 'plan': None}
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['rows'] += rows
+            entry['samples'].append(seconds)
+            if seconds < self.slow_seconds:
+                return
+            entry['slow'] += 1
+            plan = entry['plan']
+        if plan is None:
+            plan = self._explain(conn, sql, params)
+            with self._lock:
+                entry['plan'] = plan
+        logger.warning("Slow query (%.1f ms, %s rows): %s | plan: %s", seconds * 1000, rows, key[:500], plan)
+
+    def _explain(self, conn, sql, params):
+        if params is None or sql.lstrip()[:7].split(None, 1)[0].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE'):
+            return 'n/a'
+        try:
+            rows = sqlite3.Connection.cursor(conn, sqlite3.Cursor).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return f"unavailable ({e})"
+        return '; '.join(row[3] for row in rows)
+
+    def snapshot(self):
+        """Per-statement stats sorted by total time: (sql, count, total_ms, p50_ms, p99_ms, max_ms, rows, slow, plan)."""
+        with self._lock:
+            items = [(sql, dict(entry, samples=sorted(entry['samples']))) for sql, entry in self._stats.items()]
+        result = []
+        for sql, entry in items:
+            samples = entry['samples']
+            result.append((
+                sql, entry['count'], entry['seconds'] * 1000,
+                samples[len(samples) // 2] * 1000 if samples else 0.0,
+                samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000 if samples else 0.0,
+                entry['max'] * 1000, entry['rows'], entry['slow'], entry['plan'],
+            ))
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+query_stats = QueryStats()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - started, 0]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, None, time.perf_counter() - started, 0]
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add_fetch(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_fetch(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add_fetch(started, len(rows))
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _add_fetch(self, started, rows):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += rows
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, parameters, seconds, rows = pending
+        if not rows and self.rowcount > 0:
+            rows = self.rowcount
+        query_stats.record(self.connection, sql, parameters, seconds, rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+CONNECTION_FACTORY = InstrumentedConnection if QUERY_STATS_ENABLED else sqlite3.Connection
+
+# Database access layer: one dedicated writer connection fed by a queue and a
+# small pool of read-only WAL connections, so SQLite never runs on the event loop.
 class Database:
-    def __init__(self, db_file):
-        self.conn = sqlite3.connect(db_file, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+    def __init__(self, db_file, read_pool_size=DB_READ_POOL_SIZE, batch_window_ms=DB_WRITE_BATCH_WINDOW_MS, batch_max_ops=DB_WRITE_BATCH_MAX_OPS):
+        self.db_file = db_file
+        self.batch_window = batch_window_ms / 1000
+        self.batch_max_ops = max(1, batch_max_ops)
+        self._metrics_lock = threading.Lock()
+        self._batch_count = 0
+        self._batch_ops = 0
+        self._batch_max_size = 0
+        self._commit_seconds_total = 0.0
+        self._commit_seconds_max = 0.0
+        self._commit_latencies = deque(maxlen=1000)
+        self._write_queue = queue.Queue()
+        self._writer_ready = threading.Event()
+        self._op_callbacks = None
+        self._writer_error = None
+        self._reader_local = threading.local()
+        self._reader_conns = []
+        self._reader_conns_lock = threading.Lock()
+        self._read_executor = concurrent.futures.ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='db-reader')
+        self._writer_thread = threading.Thread(target=self._writer_loop, name='db-writer', daemon=True)
+        self._writer_thread.start()
+        self._writer_ready.wait()
+        if self._writer_error:
+            raise self._writer_error
+
+    def _connect_writer(self):
+        conn = sqlite3.connect(self.db_file, isolation_level=None, factory=CONNECTION_FACTORY)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connect_readonly(self):
+        """Open a standalone read-only connection for long scans that should not hold a pooled reader."""
+        uri = f"{Path(self.db_file).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=CONNECTION_FACTORY)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        return conn
 
-    def get_cursor(self):
-        return self.conn.cursor()
+    def _connect_reader(self):
+        conn = self.connect_readonly()
+        with self._reader_conns_lock:
+            self._reader_conns.append(conn)
+        return conn
 
-    def commit(self):
-        self.conn.commit()
+    def _writer_loop(self):
+        try:
+            conn = self._connect_writer()
+        except sqlite3.Error as e:
+            self._writer_error = e
+            self._writer_ready.set()
+            return
+        self._writer_ready.set()
+        running = True
+        while running:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_max_ops:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._write_queue.get(timeout=remaining) if remaining > 0 else self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn, batch):
+        # Group commit: every queued mutation runs inside its own savepoint of a
+        # single transaction, and callers are only completed once COMMIT lands.
+        started = time.perf_counter()
+        outcomes = []
+        callbacks = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_op")
+                self._op_callbacks = []
+                try:
+                    result = fn(conn)
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((future, result, None))
+                    callbacks.extend(self._op_callbacks)
+                finally:
+                    self._op_callbacks = None
+            conn.execute("COMMIT")
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error("Group commit of %s write(s) failed: %s", len(batch), e)
+            for fn, future in batch:
+                if future.running():
+                    future.set_exception(e)
+            return
+        self._record_batch(len(outcomes), time.perf_counter() - started)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("After-commit callback failed: %s", e)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _record_batch(self, size, seconds):
+        with self._metrics_lock:
+            self._batch_count += 1
+            self._batch_ops += size
+            self._batch_max_size = max(self._batch_max_size, size)
+            self._commit_seconds_total += seconds
+            self._commit_seconds_max = max(self._commit_seconds_max, seconds)
+            self._commit_latencies.append(seconds)
+
+    def write_metrics(self):
+        """Snapshot of group-commit statistics (batch sizes and commit latency)."""
+        with self._metrics_lock:
+            latencies = sorted(self._commit_latencies)
+            count = self._batch_count
+            return {
+                'batches': count,
+                'ops': self._batch_ops,
+                'avg_batch_size': self._batch_ops / count if count else 0.0,
+                'max_batch_size': self._batch_max_size,
+                'avg_commit_ms': self._commit_seconds_total * 1000 / count if count else 0.0,
+                'p99_commit_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+                'max_commit_ms': self._commit_seconds_max * 1000,
+                'queue_depth': self._write_queue.qsize(),
+            }
+
+    def _run_reader(self, fn):
+        conn = getattr(self._reader_local, 'conn', None)
+        if conn is None:
+            conn = self._connect_reader()
+            self._reader_local.conn = conn
+        return fn(conn)
+
+    def after_commit(self, callback):
+        """Run callback() once the current write op has committed; dropped if it rolls back.
+        Outside a queued write op (e.g. a standalone connection) it runs immediately."""
+        if self._op_callbacks is None or threading.current_thread() is not self._writer_thread:
+            callback()
+        else:
+            self._op_callbacks.append(callback)
+
+    def submit_write(self, fn):
+        """Queue fn(conn) for the writer from any thread and return a concurrent.futures.Future."""
+        future = concurrent.futures.Future()
+        self._write_queue.put((fn, future))
+        return future
+
+    async def run_write(self, fn):
+        """Run fn(conn) on the writer connection; it is committed atomically with its group."""
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(self.submit_write(fn))
+        finally:
+            DB_OPERATION_LATENCY.observe(time.perf_counter() - started, 'write')
+
+    async def run_read(self, fn):
+        """Run fn(conn) on a pooled read-only connection."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._read_executor, self._run_reader, fn)
+        finally:
+            DB_OPERATION_LATENCY.observe(time.perf_counter() - started, 'read')
+
+    def read_queue_depth(self):
+        return self._read_executor._work_queue.qsize()
+
+    async def execute(self, sql, params=()):
+        """Execute a single write statement and return the affected row count."""
+        return await self.run_write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def fetchone(self, sql, params=()):
+        return await self.run_read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run_read(lambda conn: conn.execute(sql, params).fetchall())
 
     def close(self):
-        self.conn.close()
+        self._write_queue.put(None)
+        self._writer_thread.join()
+        self._read_executor.shutdown(wait=True)
+        with self._reader_conns_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
 
 db = Database(DATABASE_FILE)
 
+# Bounded LRU of user balances. Writes go through credit_user_hcoin, which
+# stores the new balance here after its transaction commits, so entries are
+# never ahead of the database. Read-path fills are skipped if a balance written
+# after the read started has since been evicted, so a racing read cannot bring
+# back an older value.
+class BalanceCache:
+    def __init__(self, capacity=BALANCE_CACHE_SIZE):
+        self.capacity = max(0, capacity)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._evicted_seq = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def read_token(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def store(self, user_id: int, balance: int):
+        with self._lock:
+            self._seq += 1
+            self._entries[user_id] = (balance, self._seq)
+            self._entries.move_to_end(user_id)
+            self._trim()
+
+    def fill(self, user_id: int, balance: int, token: int):
+        with self._lock:
+            if user_id in self._entries or self._evicted_seq > token:
+                return
+            self._entries[user_id] = (balance, 0)
+            self._trim()
+
+    def _trim(self):
+        while len(self._entries) > self.capacity:
+            _, (_, seq) = self._entries.popitem(last=False)
+            self._evicted_seq = max(self._evicted_seq, seq)
+
+    def metrics(self):
+        with self._lock:
+            return {'size': len(self._entries), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses}
+
+balance_cache = BalanceCache()
+
 # Function to generate a random alphanumeric code
 def generate_random_code(length=20):
     characters = string.ascii_uppercase + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
-# Function to initialize the database and tables
-def init_db():
-    cursor = db.get_cursor()
+# Schema migrations. Each one runs exactly once, in order; the last applied
+# version is stored in the database header (PRAGMA user_version). New schema
+# changes are appended to MIGRATIONS, never edited in place.
+def migration_base_tables(conn):
+    cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS main_link (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -90,7 +783,8 @@ def init_db():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ug_phones (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            data_json TEXT NOT NULL UNIQUE
+            data_json TEXT NOT NULL,
+            content_hash BLOB
         )
     ''')
     cursor.execute('''
@@ -99,137 +793,1674 @@ def init_db():
             pastebin_url TEXT NOT NULL UNIQUE
         )
     ''')
-    db.commit()
-    initial_count, final_count = deduplicate_ug_phones_data()
-    if initial_count != final_count:
-        logger.info(f"Deduplication completed for ug_phones. Initial: {initial_count}, Final: {final_count}. Removed {initial_count - final_count} duplicates.")
+
+def migration_ug_phone_content_hash(conn):
+    migrate_ug_phones_content_hash(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ug_phones_content_hash ON ug_phones (content_hash)")
+
+def migration_ug_phone_slots(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ug_phone_slots (
+            slot INTEGER PRIMARY KEY,
+            phone_id INTEGER NOT NULL UNIQUE
+        )
+    ''')
+    # Keep ug_phone_slots dense (1..N): new rows take the next slot, and a deleted
+    # row's slot is filled by moving the last slot into it.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ug_phones_slot_insert AFTER INSERT ON ug_phones BEGIN
+            INSERT INTO ug_phone_slots (slot, phone_id)
+            VALUES ((SELECT COALESCE(MAX(slot), 0) + 1 FROM ug_phone_slots), NEW.id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ug_phones_slot_delete AFTER DELETE ON ug_phones BEGIN
+            UPDATE ug_phone_slots SET slot = -slot WHERE phone_id = OLD.id;
+            UPDATE ug_phone_slots SET slot = (SELECT -slot FROM ug_phone_slots WHERE phone_id = OLD.id)
+            WHERE slot = (SELECT MAX(slot) FROM ug_phone_slots)
+              AND slot > (SELECT -slot FROM ug_phone_slots WHERE phone_id = OLD.id);
+            DELETE FROM ug_phone_slots WHERE phone_id = OLD.id;
+        END
+    ''')
+    cursor.execute("DELETE FROM ug_phone_slots")
+    cursor.execute("INSERT INTO ug_phone_slots (slot, phone_id) SELECT ROW_NUMBER() OVER (ORDER BY id), id FROM ug_phones")
+    logger.info("Built ug_phone_slots index for %s Local Storage entries.", cursor.rowcount)
+
+def migration_ug_phone_leases(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ug_phone_leases (
+            phone_id INTEGER PRIMARY KEY,
+            data_json TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            cost INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ug_phone_leases_expires_at ON ug_phone_leases (expires_at)")
+
+def migration_credit_link_pool(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS credit_link_pool (
+            code TEXT PRIMARY KEY,
+            short_link TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+def migration_quick_add_staging(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quick_add_sessions (
+            user_id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            byte_count INTEGER NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ug_phone_staging (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            data_json TEXT NOT NULL,
+            content_hash BLOB NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ug_phone_staging_user_id ON ug_phone_staging (user_id, id)")
+
+def migration_hcoin_leaderboard(conn):
+    # Index-backed leaderboard order plus a per-balance histogram kept in sync by
+    # triggers, so rank lookups and page jumps read the histogram instead of
+    # scanning user_balances.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_balances_rank ON user_balances (hcoin_balance DESC, user_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hcoin_balance_counts (
+            balance INTEGER PRIMARY KEY,
+            users INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("UPDATE user_balances SET hcoin_balance = 0 WHERE hcoin_balance IS NULL")
+    conn.execute("DELETE FROM hcoin_balance_counts")
+    conn.execute("INSERT INTO hcoin_balance_counts (balance, users) SELECT hcoin_balance, COUNT(*) FROM user_balances GROUP BY hcoin_balance")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_balances_rank_insert AFTER INSERT ON user_balances BEGIN
+            INSERT INTO hcoin_balance_counts (balance, users) VALUES (COALESCE(NEW.hcoin_balance, 0), 1)
+            ON CONFLICT(balance) DO UPDATE SET users = users + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_balances_rank_update AFTER UPDATE OF hcoin_balance ON user_balances
+        WHEN COALESCE(OLD.hcoin_balance, 0) != COALESCE(NEW.hcoin_balance, 0) BEGIN
+            UPDATE hcoin_balance_counts SET users = users - 1 WHERE balance = COALESCE(OLD.hcoin_balance, 0);
+            DELETE FROM hcoin_balance_counts WHERE balance = COALESCE(OLD.hcoin_balance, 0) AND users <= 0;
+            INSERT INTO hcoin_balance_counts (balance, users) VALUES (COALESCE(NEW.hcoin_balance, 0), 1)
+            ON CONFLICT(balance) DO UPDATE SET users = users + 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_balances_rank_delete AFTER DELETE ON user_balances BEGIN
+            UPDATE hcoin_balance_counts SET users = users - 1 WHERE balance = COALESCE(OLD.hcoin_balance, 0);
+            DELETE FROM hcoin_balance_counts WHERE balance = COALESCE(OLD.hcoin_balance, 0) AND users <= 0;
+        END
+    ''')
+
+def migration_user_names(conn):
+    # display_name is NULL for users Discord reported as deleted
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_names (
+            user_id INTEGER PRIMARY KEY,
+            display_name TEXT,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+
+def migration_hcoin_ledger(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hcoin_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            ref TEXT,
+            ts REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_hcoin_ledger_user_id ON hcoin_ledger (user_id, id)")
+    # Opening snapshot so SUM(delta) per user reconciles with existing balances
+    conn.execute(
+        "INSERT INTO hcoin_ledger (user_id, delta, reason, ts) "
+        "SELECT user_id, hcoin_balance, 'snapshot', ? FROM user_balances WHERE hcoin_balance != 0",
+        (time.time(),)
+    )
+
+def migration_bot_state(conn):
+    # Small key/value store for worker progress that must survive restarts
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value
+        )
+    ''')
+
+MIGRATIONS = [
+    (1, migration_base_tables),
+    (2, migration_ug_phone_content_hash),
+    (3, migration_ug_phone_slots),
+    (4, migration_ug_phone_leases),
+    (5, migration_credit_link_pool),
+    (6, migration_quick_add_staging),
+    (7, migration_hcoin_leaderboard),
+    (8, migration_user_names),
+    (9, migration_hcoin_ledger),
+    (10, migration_bot_state),
+]
+
+# Function to apply pending schema migrations; returns (old_version, new_version)
+def migrate_db(conn):
+    current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        started = time.perf_counter()
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+        logger.info("Applied schema migration %s (%s) in %.1f ms.", version, migration.__name__, (time.perf_counter() - started) * 1000)
+    return current_version, MIGRATIONS[-1][0]
+
+# Uniform random Local Storage pick: two primary-key lookups through the dense
+# slot index instead of sorting the whole table with ORDER BY RANDOM()
+PICK_RANDOM_UG_PHONE_SQL = '''
+    SELECT p.id, p.data_json
+    FROM ug_phone_slots s JOIN ug_phones p ON p.id = s.phone_id
+    WHERE s.slot = (SELECT ABS(RANDOM()) % MAX(slot) + 1 FROM ug_phone_slots)
+'''
+
+# Function to get user hcoin balance
+async def get_user_hcoin(user_id: int) -> int:
+    balance = balance_cache.get(user_id)
+    if balance is not None:
+        return balance
+    token = balance_cache.read_token()
+    result = await db.fetchone("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,))
+    if result is None:
+        return 0
+    balance_cache.fill(user_id, result[0], token)
+    return result[0]
+
+# Function to get a user's balance, leaderboard rank and the number of ranked users.
+# Rank is 1 + the number of users with a strictly higher balance (ties share a rank).
+async def get_user_rank(user_id: int):
+    cached = balance_cache.get(user_id)
+    token = balance_cache.read_token()
+    balance, above, total = await db.run_read(lambda conn: read_user_rank(conn, user_id, cached))
+    if balance is None:
+        return 0, None, total
+    if cached is None:
+        balance_cache.fill(user_id, balance, token)
+    return balance, above + 1, total
+
+# Read a user's balance (unless already known) and the number of ranked users
+# above it. Returns (balance or None, above, total).
+def read_user_rank(conn, user_id: int, balance=None):
+    if balance is None:
+        row = conn.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,)).fetchone()
+        balance = row[0] if row else None
+    total, above = conn.execute(
+        "SELECT COALESCE(SUM(users), 0), COALESCE(SUM(users) FILTER (WHERE balance > ?), 0) FROM hcoin_balance_counts",
+        (balance if balance is not None else 0,)
+    ).fetchone()
+    return balance, above, total
+
+# Function to fetch one leaderboard page. Returns (rows, total_users).
+async def fetch_hcoin_top_page(page: int, page_size: int = HCOIN_TOP_PAGE_SIZE):
+    return await db.run_read(lambda conn: read_hcoin_top_page(conn, (page - 1) * page_size, page_size))
+
+# Read the leaderboard rows starting at offset. The histogram locates the balance
+# the page starts in, so only that balance's ties are skipped via OFFSET on the rank index.
+def read_hcoin_top_page(conn, offset: int, page_size: int):
+    total = conn.execute("SELECT COALESCE(SUM(users), 0) FROM hcoin_balance_counts").fetchone()[0]
+    if offset >= total:
+        return [], total
+    start = conn.execute(
+        "SELECT balance, above FROM (SELECT balance, SUM(users) OVER (ORDER BY balance DESC) - users AS above FROM hcoin_balance_counts) "
+        "WHERE above <= ? ORDER BY balance LIMIT 1",
+        (offset,)
+    ).fetchone()
+    rows = conn.execute(
+        "SELECT user_id, hcoin_balance FROM user_balances WHERE hcoin_balance <= ? "
+        "ORDER BY hcoin_balance DESC, user_id LIMIT ? OFFSET ?",
+        (start[0], page_size, offset - start[1])
+    ).fetchall()
+    return rows, total
+
+# Function to update user hcoin balance and return the new balance
+async def update_user_hcoin(user_id: int, amount: int, reason: str = 'adjust', ref=None) -> int:
+    return await db.run_write(lambda conn: credit_user_hcoin(conn, user_id, amount, reason, ref))
+
+# Credit hcoin inside an open write transaction and return the new balance.
+# Every change is appended to hcoin_ledger in the same transaction; user_balances
+# is the rollup of that ledger.
+def credit_user_hcoin(conn, user_id: int, amount: int, reason: str = 'adjust', ref=None) -> int:
+    conn.execute(
+        "INSERT INTO hcoin_ledger (user_id, delta, reason, ref, ts) VALUES (?, ?, ?, ?, ?)",
+        (user_id, amount, reason, None if ref is None else str(ref), time.time())
+    )
+    row = conn.execute(
+        "INSERT INTO user_balances (user_id, hcoin_balance) VALUES (?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET hcoin_balance = COALESCE(hcoin_balance, 0) + excluded.hcoin_balance "
+        "RETURNING hcoin_balance",
+        (user_id, amount)
+    ).fetchone()
+    new_balance = row[0]
+    db.after_commit(lambda: balance_cache.store(user_id, new_balance))
+    return new_balance
+
+# Debit hcoin only if the balance covers it, as one conditional UPDATE inside an
+# open write transaction. Returns (debited, balance): the new balance, or the
+# unchanged one when it was too low.
+def debit_user_hcoin(conn, user_id: int, amount: int, reason: str = 'adjust', ref=None):
+    row = conn.execute(
+        "UPDATE user_balances SET hcoin_balance = hcoin_balance - ? WHERE user_id = ? AND hcoin_balance >= ? RETURNING hcoin_balance",
+        (amount, user_id, amount)
+    ).fetchone()
+    if row is None:
+        current = conn.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,)).fetchone()
+        return False, current[0] if current else 0
+    conn.execute(
+        "INSERT INTO hcoin_ledger (user_id, delta, reason, ref, ts) VALUES (?, ?, ?, ?, ?)",
+        (user_id, -amount, reason, None if ref is None else str(ref), time.time())
+    )
+    new_balance = row[0]
+    db.after_commit(lambda: balance_cache.store(user_id, new_balance))
+    return True, new_balance
+
+# Function to redeem a batch of codes in one transaction
+async def redeem_codes(user_id: int, codes: list):
+    """Claim all codes with one set-based DELETE, credit the user once and
+    return (redeemed_codes, failed_codes, new_balance) from the same transaction."""
+    unique_codes = list(dict.fromkeys(codes))
+    claimed, new_balance = await db.run_write(lambda conn: claim_redemption_codes(conn, user_id, unique_codes))
+    redeemed_codes = []
+    failed_codes = []
+    for code in codes:
+        if code in claimed:
+            redeemed_codes.append(code)
+            claimed.discard(code)
+        else:
+            failed_codes.append(code)
+    return redeemed_codes, failed_codes, new_balance
+
+# Delete the given codes inside an open write transaction and credit the user
+# for the ones that existed. Returns (claimed_codes, new_balance).
+def claim_redemption_codes(conn, user_id: int, codes: list):
+    claimed = {row[0] for row in conn.execute(
+        "DELETE FROM redemption_codes WHERE code IN (SELECT value FROM json_each(?)) RETURNING code",
+        (json.dumps(codes),)
+    ).fetchall()}
+    if claimed:
+        new_balance = credit_user_hcoin(conn, user_id, len(claimed) * HCOIN_PER_CODE, 'redeem', ','.join(sorted(claimed)))
     else:
-        logger.info("No duplicates found in ug_phones table during startup deduplication.")
+        row = conn.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,)).fetchone()
+        new_balance = row[0] if row else 0
+    return claimed, new_balance
+
+# Canonical content hash for Local Storage JSON, so entries that differ only in
+# key order or whitespace are treated as duplicates
+def ug_phone_content_hash(data_json: str) -> bytes:
+    try:
+        value = json.loads(data_json)
+    except json.JSONDecodeError:
+        return hashlib.blake2b(data_json.encode('utf-8'), digest_size=16).digest()
+    return canonical_json_hash(value)
+
+# Same hash for an already-parsed JSON value
+def canonical_json_hash(value) -> bytes:
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+# Function to insert one Local Storage entry; returns False when it is a duplicate
+def insert_ug_phone(conn, data_json: str) -> bool:
+    cursor = conn.execute("INSERT OR IGNORE INTO ug_phones (data_json, content_hash) VALUES (?, ?)", (data_json, ug_phone_content_hash(data_json)))
+    return cursor.rowcount > 0
+
+# Rebuild a legacy ug_phones table (UNIQUE on the raw data_json text) into the
+# hashed layout, keeping the oldest row of every canonical duplicate
+def migrate_ug_phones_content_hash(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(ug_phones)")]
+    if 'content_hash' in columns:
+        return
+    logger.info("Migrating ug_phones to canonical content-hash deduplication...")
+    conn.execute('''
+        CREATE TABLE ug_phones_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data_json TEXT NOT NULL,
+            content_hash BLOB
+        )
+    ''')
+    conn.execute("CREATE UNIQUE INDEX idx_ug_phones_content_hash ON ug_phones_new (content_hash)")
+    initial_count = conn.execute("SELECT COUNT(*) FROM ug_phones").fetchone()[0]
+    rows = conn.execute("SELECT id, data_json FROM ug_phones ORDER BY id")
+    kept_count = conn.executemany(
+        "INSERT OR IGNORE INTO ug_phones_new (id, data_json, content_hash) VALUES (?, ?, ?)",
+        ((item_id, data_json, ug_phone_content_hash(data_json)) for item_id, data_json in rows)
+    ).rowcount
+    old_seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ug_phones'").fetchone()
+    conn.execute("DROP TABLE ug_phones")
+    conn.execute("ALTER TABLE ug_phones_new RENAME TO ug_phones")
+    if old_seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'ug_phones'", (old_seq[0],))
+    logger.info("ug_phones migration to content hashes completed. Kept %s of %s entries, removed %s canonical duplicates.", kept_count, initial_count, initial_count - kept_count)
+
+# Function to deduplicate ug_phones data. Only rows without a content hash
+# (inserted outside insert_ug_phone) need checking; everything else is kept
+# unique by the content_hash index.
+def deduplicate_ug_phones_data(conn):
+    cursor = conn.cursor()
+    initial_count = cursor.execute("SELECT COALESCE(MAX(slot), 0) FROM ug_phone_slots").fetchone()[0]
+    removed_count = 0
+    for item_id, data_json in cursor.execute("SELECT id, data_json FROM ug_phones WHERE content_hash IS NULL ORDER BY id").fetchall():
+        content_hash = ug_phone_content_hash(data_json)
+        if conn.execute("SELECT 1 FROM ug_phones WHERE content_hash = ?", (content_hash,)).fetchone():
+            conn.execute("DELETE FROM ug_phones WHERE id = ?", (item_id,))
+            removed_count += 1
+        else:
+            conn.execute("UPDATE ug_phones SET content_hash = ? WHERE id = ?", (content_hash, item_id))
+    return initial_count, initial_count - removed_count
+
+# Function to generate web link with random code
+def create_web_generator_link(code: str):
+    web_link = f"{WEB_GENERATOR_BASE_URL}{code}"
+    logger.info("Generated web link for code %s: %s", code, web_link)
+    return web_link
+
+class ShortenerError(Exception):
+    """Transient Yeumoney failure (network, timeout, 5xx or malformed JSON) that is worth retrying."""
+
+# Asyncio-native Yeumoney client: one keep-alive session, capped concurrency,
+# jittered exponential backoff and a circuit breaker that fails fast while the API is down.
+class ShortenerClient:
+    def __init__(self, api_url=YEUMONEY_API_URL, token=YEUMONEY_API_TOKEN, timeout=SHORTENER_TIMEOUT,
+                 max_concurrency=SHORTENER_MAX_CONCURRENCY, max_attempts=SHORTENER_MAX_ATTEMPTS,
+                 backoff_base=SHORTENER_BACKOFF_BASE, backoff_max=SHORTENER_BACKOFF_MAX,
+                 breaker_threshold=SHORTENER_BREAKER_THRESHOLD, breaker_cooldown=SHORTENER_BREAKER_COOLDOWN):
+        self.api_url = api_url
+        self.token = token
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = max(1, breaker_threshold)
+        self.breaker_cooldown = breaker_cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.latency_seconds_total = 0.0
+        self._half_open_probe = False
+        self._session = None
+        self._semaphore = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @property
+    def state(self):
+        if self.consecutive_failures < self.breaker_threshold:
+            return 'closed'
+        return 'open' if time.monotonic() < self.open_until else 'half-open'
+
+    def _allow_request(self):
+        """Return (allowed, is_probe); is_probe is True for the single half-open trial call."""
+        state = self.state
+        if state == 'closed':
+            return True, False
+        if state == 'half-open' and not self._half_open_probe:
+            self._half_open_probe = True
+            return True, True
+        return False, False
+
+    def _record_result(self, ok, is_probe):
+        if is_probe:
+            self._half_open_probe = False
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures == self.breaker_threshold or is_probe:
+            self.open_until = time.monotonic() + self.breaker_cooldown
+            logger.error("Yeumoney circuit breaker opened for %.0fs after %s consecutive failures.", self.breaker_cooldown, self.consecutive_failures)
+
+    async def _request(self, long_url):
+        params = {
+            "token": self.token,
+            "url": long_url,
+            "format": "json"
+        }
+        session = self._get_session()
+        async with self._semaphore:
+            try:
+                async with session.get(self.api_url, params=params) as response:
+                    body = await response.text()
+                    if response.status >= 500:
+                        raise ShortenerError(f"HTTP {response.status} from Yeumoney.com API")
+                    if response.status >= 400:
+                        logger.error("Yeumoney.com API rejected the request with HTTP %s: %s", response.status, body[:200])
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise ShortenerError(f"Error connecting to Yeumoney.com API: {e!r}") from e
+        try:
+            result = json.loads(body)
+        except json.JSONDecodeError:
+            raise ShortenerError(f"Error decoding JSON from Yeumoney.com API response: {body[:200]}")
+        if isinstance(result, dict) and result.get("status") == "success" and "shortenedUrl" in result:
+            return result["shortenedUrl"]
+        error_message = result.get("message", "Unknown API error.") if isinstance(result, dict) else "Unknown API error."
+        logger.error("Error creating short link on Yeumoney.com. API response: %s. Error: %s", result, error_message)
+        return None
+
+    async def shorten(self, long_url: str):
+        if not self.token:
+            logger.error("Error: YEUMONEY_API_TOKEN is not set in environment variables.")
+            return None
+        allowed, is_probe = self._allow_request()
+        if not allowed:
+            self.short_circuited += 1
+            logger.warning("Yeumoney circuit breaker is open; failing fast.")
+            return None
+        self.calls += 1
+        started = time.perf_counter()
+        outcome = 'failure'
+        try:
+            for attempt in range(self.max_attempts):
+                try:
+                    short_link = await self._request(long_url)
+                except ShortenerError as e:
+                    logger.warning("Yeumoney attempt %s/%s failed: %s", attempt + 1, self.max_attempts, e)
+                    if attempt + 1 < self.max_attempts:
+                        await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                    continue
+                self._record_result(True, is_probe)
+                if short_link:
+                    self.successes += 1
+                    outcome = 'success'
+                    logger.info("Successfully created short link: %s", short_link)
+                else:
+                    self.failures += 1
+                return short_link
+            self.failures += 1
+            self._record_result(False, is_probe)
+            return None
+        finally:
+            # A probe that was cancelled (or raised) never recorded a result; free the
+            # slot so the next call can probe instead of the breaker staying shut.
+            if is_probe:
+                self._half_open_probe = False
+            elapsed = time.perf_counter() - started
+            self.latency_seconds_total += elapsed
+            SHORTENER_LATENCY.observe(elapsed, outcome)
+
+    def metrics(self):
+        return {
+            'state': self.state,
+            'calls': self.calls,
+            'successes': self.successes,
+            'failures': self.failures,
+            'short_circuited': self.short_circuited,
+            'consecutive_failures': self.consecutive_failures,
+            'avg_latency_ms': self.latency_seconds_total * 1000 / self.calls if self.calls else 0.0,
+        }
+
+shortener = ShortenerClient()
+
+async def create_short_link(long_url: str):
+    return await shortener.shorten(long_url)
+
+# Background producer that keeps a warm pool of ready (code, short_link) pairs so
+# /getcredit never waits on the shortener. Pooled codes only become redeemable
+# once they are handed out.
+class CreditLinkPool:
+    def __init__(self, size=CREDIT_POOL_SIZE, low_water=CREDIT_POOL_LOW_WATER, concurrency=CREDIT_POOL_REFILL_CONCURRENCY):
+        self.size = size
+        self.low_water = min(low_water, size)
+        self.concurrency = max(1, concurrency)
+        self.depth = 0
+        self.minted = 0
+        self.mint_failures = 0
+        self.dispensed = 0
+        self.misses = 0
+        self._refill_event = None
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._refill_event = asyncio.Event()
+            self._task = asyncio.create_task(self._producer(), name='credit-link-pool')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self):
+        return {
+            'depth': self.depth,
+            'size': self.size,
+            'low_water': self.low_water,
+            'minted': self.minted,
+            'mint_failures': self.mint_failures,
+            'dispensed': self.dispensed,
+            'misses': self.misses,
+        }
+
+    async def mint(self):
+        generated_code = generate_random_code(20)
+        web_link = create_web_generator_link(generated_code)
+        short_link = await create_short_link(web_link)
+        if not short_link:
+            self.mint_failures += 1
+            return None
+        self.minted += 1
+        return generated_code, short_link
+
+    async def _refill(self):
+        self.depth = (await db.fetchone("SELECT COUNT(*) FROM credit_link_pool"))[0]
+        missing = self.size - self.depth
+        if missing <= 0:
+            return
+        logger.info("Refilling credit link pool: depth %s/%s, minting %s.", self.depth, self.size, missing)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def mint_into_pool():
+            async with semaphore:
+                entry = await self.mint()
+            if entry:
+                inserted = await db.execute("INSERT OR IGNORE INTO credit_link_pool (code, short_link, created_at) VALUES (?, ?, ?)", (*entry, time.time()))
+                self.depth += inserted
+
+        await asyncio.gather(*(mint_into_pool() for _ in range(missing)))
+        logger.info("Credit link pool refilled: depth %s/%s.", self.depth, self.size)
+
+    async def _producer(self):
+        while True:
+            # Clear before refilling so a low-water signal from pop() during the refill is kept
+            self._refill_event.clear()
+            try:
+                await self._refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error refilling credit link pool: %s", e)
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=CREDIT_POOL_REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def pop(self):
+        """Atomically take one pooled pair and register its code for redemption."""
+        def take(conn):
+            row = conn.execute(
+                "DELETE FROM credit_link_pool WHERE code = (SELECT code FROM credit_link_pool ORDER BY created_at LIMIT 1) "
+                "RETURNING code, short_link"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("INSERT INTO redemption_codes (code) VALUES (?)", (row[0],))
+            return row[0], row[1]
+
+        entry = await db.run_write(take)
+        if entry is None:
+            self.misses += 1
+            self.depth = 0
+        else:
+            self.dispensed += 1
+            self.depth = max(0, self.depth - 1)
+        if self.depth < self.low_water and self._refill_event is not None:
+            self._refill_event.set()
+        return entry
+
+    async def mint_direct(self):
+        """Fallback when the pool is empty: mint a pair inline and register its code."""
+        entry = await self.mint()
+        if entry:
+            await db.execute("INSERT INTO redemption_codes (code) VALUES (?)", (entry[0],))
+        return entry
+
+credit_pool = CreditLinkPool()
+
+# Claim/lease protocol for /getugphone. Claiming moves one random item out of
+# ug_phones into ug_phone_leases and charges the user in the same transaction,
+# so concurrent claims can never pick the same row. Delivery then commits the
+# lease, a failure releases it (item back in stock, coins refunded), and the
+# sweeper does the same for leases that were never resolved.
+class UGPhoneLeaseManager:
+    def __init__(self, ttl=UG_PHONE_LEASE_TTL, sweep_interval=UG_PHONE_LEASE_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sweeper(), name='ug-phone-lease-sweeper')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def claim(self, user_id: int, cost: int):
+        """Return ('leased', (item_id, data_json)), ('insufficient', balance) or ('empty', None)."""
+        def lease(conn):
+            if cost > 0:
+                row = conn.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,)).fetchone()
+                balance = row[0] if row else 0
+                if balance < cost:
+                    return 'insufficient', balance
+            item = conn.execute(PICK_RANDOM_UG_PHONE_SQL).fetchone()
+            if item is None:
+                return 'empty', None
+            item_id, data_json = item
+            conn.execute("DELETE FROM ug_phones WHERE id = ?", (item_id,))
+            conn.execute(
+                "INSERT INTO ug_phone_leases (phone_id, data_json, user_id, cost, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (item_id, data_json, user_id, cost, time.time() + self.ttl)
+            )
+            if cost > 0:
+                credit_user_hcoin(conn, user_id, -cost, 'ugphone_purchase', item_id)
+            return 'leased', (item_id, data_json)
+
+        return await db.run_write(lease)
+
+    async def commit(self, user_id: int, item_id: int, cost: int):
+        """Mark the item as delivered. Returns 'committed', 'reclaimed' (the lease had
+        expired; the item was taken back out of stock) or 'leased_elsewhere' (the
+        expired item was already leased to another user)."""
+        def finish(conn):
+            if conn.execute("DELETE FROM ug_phone_leases WHERE phone_id = ? AND user_id = ?", (item_id, user_id)).rowcount:
+                return 'committed', 0
+            # The sweeper already expired the lease, refunded the user and restocked the
+            # item. The user has it anyway, so charge again and take it back out of stock,
+            # unless another user's lease now holds it. The refund may have been spent in
+            # the meantime: charge what the balance covers and report the rest.
+            shortfall = 0
+            if cost > 0:
+                row = conn.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,)).fetchone()
+                charge = min(cost, max(0, row[0] if row else 0))
+                shortfall = cost - charge
+                if charge > 0:
+                    debit_user_hcoin(conn, user_id, charge, 'ugphone_late_delivery', item_id)
+            removed = conn.execute(
+                "DELETE FROM ug_phones WHERE id = ? AND NOT EXISTS (SELECT 1 FROM ug_phone_leases WHERE phone_id = ?)",
+                (item_id, item_id)
+            ).rowcount
+            if removed or not conn.execute("SELECT 1 FROM ug_phone_leases WHERE phone_id = ?", (item_id,)).fetchone():
+                return 'reclaimed', shortfall
+            return 'leased_elsewhere', shortfall
+
+        status, shortfall = await db.run_write(finish)
+        if shortfall:
+            logger.error("User %s spent the refund for Local Storage ID %s before the late delivery was confirmed; %s of %s coins could not be re-charged.", user_id, item_id, shortfall, cost)
+        if status == 'reclaimed':
+            logger.warning("Lease for Local Storage ID %s (user %s) expired before delivery was confirmed; re-charged %s coins and removed it from stock.", item_id, user_id, cost - shortfall)
+        elif status == 'leased_elsewhere':
+            logger.error("Lease for Local Storage ID %s (user %s) expired before delivery was confirmed and the item is already leased to another user; it will be delivered twice.", item_id, user_id)
+        return status
+
+    async def release(self, user_id: int, item_id: int):
+        def restore(conn):
+            row = conn.execute(
+                "DELETE FROM ug_phone_leases WHERE phone_id = ? AND user_id = ? RETURNING data_json, cost",
+                (item_id, user_id)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("INSERT OR IGNORE INTO ug_phones (id, data_json, content_hash) VALUES (?, ?, ?)", (item_id, row[0], ug_phone_content_hash(row[0])))
+            if row[1] > 0:
+                credit_user_hcoin(conn, user_id, row[1], 'ugphone_refund', item_id)
+            return row[1]
+
+        refunded = await db.run_write(restore)
+        if refunded:
+            logger.info("Refunded %s coins to user %s due to DM failure for Local Storage ID %s.", refunded, user_id, item_id)
+
+    async def sweep(self):
+        def reclaim(conn):
+            expired = conn.execute(
+                "DELETE FROM ug_phone_leases WHERE expires_at <= ? RETURNING phone_id, data_json, user_id, cost",
+                (time.time(),)
+            ).fetchall()
+            for phone_id, data_json, user_id, cost in expired:
+                conn.execute("INSERT OR IGNORE INTO ug_phones (id, data_json, content_hash) VALUES (?, ?, ?)", (phone_id, data_json, ug_phone_content_hash(data_json)))
+                if cost > 0:
+                    credit_user_hcoin(conn, user_id, cost, 'ugphone_refund', phone_id)
+            return len(expired)
+
+        reclaimed = await db.run_write(reclaim)
+        if reclaimed:
+            logger.warning("Reclaimed %s expired Local Storage lease(s) and refunded their coins.", reclaimed)
+        return reclaimed
+
+    async def _sweeper(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error sweeping expired Local Storage leases: %s", e)
+            await asyncio.sleep(self.sweep_interval)
+
+ug_phone_leases = UGPhoneLeaseManager()
+
+# Periodically folds ledger entries older than the retention window into one
+# 'snapshot' row per user. The snapshot reuses the lowest compacted id so the
+# per-user history stays in order, and SUM(delta) is unchanged. The highest id
+# already compacted is kept in bot_state, written in the same transaction as the
+# snapshots, so a restart resumes where the last batch ended.
+class HcoinLedgerCompactor:
+    def __init__(self, retention_days=HCOIN_LEDGER_RETENTION_DAYS, interval=HCOIN_LEDGER_COMPACT_INTERVAL, batch_size=HCOIN_LEDGER_COMPACT_BATCH):
+        self.retention = retention_days * 86400
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker(), name='hcoin-ledger-compactor')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def compact_once(self):
+        """Compact up to batch_size old entries. Returns (rows_removed, reached_cutoff)."""
+        cutoff = time.time() - self.retention
+
+        def compact(conn):
+            row = conn.execute("SELECT value FROM bot_state WHERE key = 'hcoin_ledger_compacted_upto'").fetchone()
+            low = row[0] if row else 0
+            bounds = conn.execute(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id, ts FROM hcoin_ledger WHERE id > ? ORDER BY id LIMIT ?) WHERE ts < ?",
+                (low, self.batch_size, cutoff)
+            ).fetchone()
+            high = bounds[0]
+            if high is None:
+                return 0, True
+            groups = conn.execute(
+                "SELECT MIN(id), user_id, SUM(delta), MAX(ts) FROM hcoin_ledger WHERE id > ? AND id <= ? AND ts < ? "
+                "GROUP BY user_id HAVING COUNT(*) > 1",
+                (low, high, cutoff)
+            ).fetchall()
+            removed = 0
+            for first_id, user_id, total, last_ts in groups:
+                removed += conn.execute(
+                    "DELETE FROM hcoin_ledger WHERE user_id = ? AND id > ? AND id <= ? AND ts < ?",
+                    (user_id, low, high, cutoff)
+                ).rowcount
+                conn.execute(
+                    "INSERT INTO hcoin_ledger (id, user_id, delta, reason, ts) VALUES (?, ?, ?, 'snapshot', ?)",
+                    (first_id, user_id, total, last_ts)
+                )
+                removed -= 1
+            conn.execute(
+                "INSERT INTO bot_state (key, value) VALUES ('hcoin_ledger_compacted_upto', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (high,)
+            )
+            return removed, bounds[1] < self.batch_size
+
+        return await db.run_write(compact)
+
+    async def _worker(self):
+        while True:
+            try:
+                total = 0
+                while True:
+                    removed, done = await self.compact_once()
+                    total += removed
+                    if done:
+                        break
+                if total:
+                    logger.info("Compacted %s Hcoin ledger entries into snapshots.", total)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error compacting the Hcoin ledger: %s", e)
+            await asyncio.sleep(self.interval)
+
+hcoin_ledger_compactor = HcoinLedgerCompactor()
+
+# Function to read one page of a user's Hcoin history, newest first.
+# Returns up to `limit` rows of (id, delta, reason, ref, ts); pass the last id as before_id for the next page.
+async def get_hcoin_history(user_id: int, limit: int = HCOIN_HISTORY_PAGE_SIZE, before_id: int = None):
+    if before_id is None:
+        return await db.fetchall(
+            "SELECT id, delta, reason, ref, ts FROM hcoin_ledger WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        )
+    return await db.fetchall(
+        "SELECT id, delta, reason, ref, ts FROM hcoin_ledger WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+        (user_id, before_id, limit)
+    )
+
+# Durable staging for /quickaddug. Entries are validated once when they arrive,
+# written to ug_phone_staging, and moved into ug_phones with a single
+# INSERT ... SELECT when the session ends. Only session expiry times are kept in
+# memory, so restarts lose nothing and RAM does not grow with session size.
+class QuickAddStaging:
+    def __init__(self, ttl=QUICKADD_SESSION_TTL, max_items=QUICKADD_MAX_ITEMS, max_bytes=QUICKADD_MAX_BYTES, ack_delay=QUICKADD_ACK_DELAY):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ack_delay = ack_delay
+        self.sessions = quick_add_ug_sessions
+        self._pending_acks = {}
+        self._task = None
+
+    async def load(self):
+        rows = await db.fetchall("SELECT user_id, expires_at FROM quick_add_sessions")
+        self.sessions.clear()
+        self.sessions.update((row[0], row[1]) for row in rows)
+        if rows:
+            logger.info("Restored %s /quickaddug session(s) from staging.", len(rows))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sweeper(), name='quick-add-staging-sweeper')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_active(self, user_id: int) -> bool:
+        expires_at = self.sessions.get(user_id)
+        return expires_at is not None and expires_at > time.time()
+
+    async def open(self, user_id: int, channel_id: int) -> bool:
+        def create(conn):
+            now = time.time()
+            row = conn.execute("SELECT expires_at FROM quick_add_sessions WHERE user_id = ?", (user_id,)).fetchone()
+            if row is not None and row[0] > now:
+                return None
+            conn.execute("DELETE FROM ug_phone_staging WHERE user_id = ?", (user_id,))
+            conn.execute("INSERT OR REPLACE INTO quick_add_sessions (user_id, channel_id, expires_at) VALUES (?, ?, ?)", (user_id, channel_id, now + self.ttl))
+            return now + self.ttl
+
+        expires_at = await db.run_write(create)
+        if expires_at is None:
+            return False
+        self.sessions[user_id] = expires_at
+        return True
+
+    async def stage(self, user_id: int, content: str) -> str:
+        """Validate and stage one entry. Returns 'staged', 'invalid', 'full' or 'expired'."""
+        try:
+            content_hash = canonical_json_hash(json.loads(content))
+        except json.JSONDecodeError:
+            return 'invalid'
+        size = len(content.encode('utf-8'))
+
+        def insert(conn):
+            now = time.time()
+            updated = conn.execute(
+                "UPDATE quick_add_sessions SET item_count = item_count + 1, byte_count = byte_count + ?, expires_at = ? "
+                "WHERE user_id = ? AND expires_at > ? AND item_count < ? AND byte_count + ? <= ?",
+                (size, now + self.ttl, user_id, now, self.max_items, size, self.max_bytes)
+            ).rowcount
+            if not updated:
+                exists = conn.execute("SELECT 1 FROM quick_add_sessions WHERE user_id = ? AND expires_at > ?", (user_id, now)).fetchone()
+                return ('full' if exists else 'expired'), None
+            conn.execute("INSERT INTO ug_phone_staging (user_id, data_json, content_hash) VALUES (?, ?, ?)", (user_id, content, content_hash))
+            return 'staged', now + self.ttl
+
+        status, expires_at = await db.run_write(insert)
+        if status == 'staged':
+            self.sessions[user_id] = expires_at
+        elif status == 'expired':
+            self.sessions.pop(user_id, None)
+        return status
+
+    async def commit(self, user_id: int):
+        """Move the session's staged entries into ug_phones. Returns (staged_count, added_count)."""
+        def move(conn):
+            staged_count = conn.execute("SELECT COUNT(*) FROM ug_phone_staging WHERE user_id = ?", (user_id,)).fetchone()[0]
+            added_count = conn.execute(
+                "INSERT OR IGNORE INTO ug_phones (data_json, content_hash) "
+                "SELECT data_json, content_hash FROM ug_phone_staging WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).rowcount
+            conn.execute("DELETE FROM ug_phone_staging WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM quick_add_sessions WHERE user_id = ?", (user_id,))
+            return staged_count, added_count
+
+        # Confirm the last burst before `done` instead of dropping it
+        await self.flush_ack(user_id)
+        result = await db.run_write(move)
+        self.sessions.pop(user_id, None)
+        return result
+
+    async def cancel(self, user_id: int):
+        def discard(conn):
+            conn.execute("DELETE FROM ug_phone_staging WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM quick_add_sessions WHERE user_id = ?", (user_id,))
+
+        self._drop_ack(user_id)
+        await db.run_write(discard)
+        self.sessions.pop(user_id, None)
+
+    async def sweep(self):
+        def expire(conn):
+            expired = [row[0] for row in conn.execute("DELETE FROM quick_add_sessions WHERE expires_at <= ? RETURNING user_id", (time.time(),)).fetchall()]
+            if expired:
+                conn.execute("DELETE FROM ug_phone_staging WHERE user_id IN (SELECT value FROM json_each(?))", (json.dumps(expired),))
+            return expired
+
+        expired = await db.run_write(expire)
+        for user_id in expired:
+            self.sessions.pop(user_id, None)
+        if expired:
+            logger.info("Expired %s idle /quickaddug session(s) and discarded their staged entries.", len(expired))
+
+    async def _sweeper(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error sweeping /quickaddug staging: %s", e)
+            await asyncio.sleep(max(30.0, self.ttl / 10))
+
+    def acknowledge(self, message: discord.Message, valid: bool):
+        """Batch confirmations: one reaction on the last message of each burst instead of one per message."""
+        pending = self._pending_acks.get(message.author.id)
+        if pending is None:
+            pending = {'valid': 0, 'invalid': 0}
+            pending['task'] = asyncio.create_task(self._flush_ack(message.author.id))
+            self._pending_acks[message.author.id] = pending
+        pending['message'] = message
+        pending['valid' if valid else 'invalid'] += 1
+
+    def _drop_ack(self, user_id: int):
+        pending = self._pending_acks.pop(user_id, None)
+        if pending is not None:
+            pending['task'].cancel()
+
+    async def flush_ack(self, user_id: int):
+        """Send the user's pending confirmation now instead of after the batching delay."""
+        pending = self._pending_acks.pop(user_id, None)
+        if pending is not None:
+            pending['task'].cancel()
+            await self._send_ack(user_id, pending)
+
+    async def _flush_ack(self, user_id: int):
+        await asyncio.sleep(self.ack_delay)
+        pending = self._pending_acks.pop(user_id, None)
+        if pending is not None:
+            await self._send_ack(user_id, pending)
+
+    async def _send_ack(self, user_id: int, pending: dict):
+        message = pending['message']
+        try:
+            if not pending['invalid']:
+                await message.add_reaction("✅")
+            else:
+                await message.add_reaction("⚠️")
+                await message.channel.send(embed=discord.Embed(
+                    title="❌ Dữ liệu không hợp lệ!",
+                    description=f"Đã nhận **{pending['valid']}** Local Storage hợp lệ. "
+                                f"**{pending['invalid']}** tin nhắn không phải JSON hợp lệ hoặc vượt quá giới hạn phiên và đã bị bỏ qua.",
+                    color=discord.Color.red()
+                ))
+        except discord.HTTPException as e:
+            logger.warning("Could not acknowledge /quickaddug messages for user %s: %s", user_id, e)
+
+quick_add_staging = QuickAddStaging()
+
+# Function to build the embed sent when a /quickaddug session timed out
+def build_quick_add_expired_embed():
+    return discord.Embed(
+        title="⌛ Phiên đã hết hạn!",
+        description="Phiên nhập Local Storage của bạn đã hết hạn do không hoạt động. Dùng /quickaddug để bắt đầu lại.",
+        color=discord.Color.orange()
+    )
+
+# Resolves user IDs to display names for leaderboards. Lookups go to the gateway
+# cache first, then the user_names table, and only then to fetch_user, with
+# bounded parallelism. Stale stored names are served immediately and refreshed
+# in the background; concurrent lookups of the same ID share one request.
+class UserNameResolver:
+    def __init__(self, ttl=USER_NAME_TTL, concurrency=USER_NAME_FETCH_CONCURRENCY):
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight = {}
+        self._refresh_tasks = set()
+
+    async def stop(self):
+        for task in list(self._refresh_tasks):
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        self._refresh_tasks.clear()
+
+    async def resolve_many(self, user_ids) -> dict:
+        names = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user = bot.get_user(user_id)
+            if user is not None:
+                names[user_id] = user.display_name
+            else:
+                missing.append(user_id)
+        if not missing:
+            return names
+
+        rows = await db.fetchall(
+            "SELECT user_id, display_name, fetched_at FROM user_names WHERE user_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(missing),)
+        )
+        now = time.time()
+        stale = []
+        for user_id, display_name, fetched_at in rows:
+            names[user_id] = display_name if display_name is not None else f"Người dùng không tồn tại (ID: {user_id})"
+            if now - fetched_at > self.ttl:
+                stale.append(user_id)
+        unknown = [user_id for user_id in missing if user_id not in names]
+
+        if stale:
+            task = asyncio.create_task(self._fetch_and_store(stale))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        if unknown:
+            names.update(await self._fetch_and_store(unknown))
+        return names
+
+    async def _fetch_and_store(self, user_ids) -> dict:
+        results = await asyncio.gather(*(self._fetch(user_id) for user_id in user_ids))
+        names = {}
+        store = []
+        now = time.time()
+        for user_id, (found, display_name) in zip(user_ids, results):
+            if found is None:
+                names[user_id] = f"Không thể lấy tên (ID: {user_id})"
+                continue
+            names[user_id] = display_name if found else f"Người dùng không tồn tại (ID: {user_id})"
+            store.append((user_id, display_name if found else None, now))
+        if store:
+            # The caller is rendering a page; write the cache behind it
+            task = asyncio.create_task(self._store(store))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        return names
+
+    async def _store(self, store):
+        try:
+            await db.run_write(lambda conn: conn.executemany(
+                "INSERT INTO user_names (user_id, display_name, fetched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET display_name = excluded.display_name, fetched_at = excluded.fetched_at",
+                store
+            ))
+        except Exception as e:
+            logger.error("Error caching %s resolved user name(s): %s", len(store), e)
+
+    async def _fetch(self, user_id: int):
+        """Return (True, name), (False, None) for deleted users, or (None, None) on other errors."""
+        future = self._inflight.get(user_id)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            async with self._semaphore:
+                try:
+                    user = await bot.fetch_user(user_id)
+                    result = (True, user.display_name)
+                except discord.NotFound:
+                    result = (False, None)
+                except Exception as e:
+                    logger.warning("Could not fetch user %s for name resolution: %s", user_id, e)
+                    result = (None, None)
+            future.set_result(result)
+            return result
+        finally:
+            # If this lookup was cancelled, callers sharing it fall back to the "cannot fetch" label
+            if not future.done():
+                future.set_result((None, None))
+            self._inflight.pop(user_id, None)
+
+user_names = UserNameResolver()
+
+# One admission lane per expensive command: a global token bucket in front of a
+# bounded queue served round-robin per user, so one user spamming cannot starve
+# others. Requests that would wait longer than max_wait, or find the queue full,
+# are shed immediately with a retry hint instead of piling onto the shortener
+# and the writer.
+class AdmissionLane:
+    def __init__(self, name, rate, burst, max_queue=ADMISSION_QUEUE_SIZE, max_per_user=ADMISSION_QUEUE_PER_USER, max_wait=ADMISSION_MAX_WAIT):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waiters = OrderedDict()
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, user_id: int):
+        """Wait for a slot. Returns None once admitted, or the suggested retry delay in seconds if shed."""
+        self._refill()
+        if not self.queued and self.tokens >= 1:
+            self.tokens -= 1
+            self.admitted += 1
+            return None
+        expected_wait = (self.queued + 1 - self.tokens) / self.rate
+        user_queued = len(self.waiters.get(user_id, ()))
+        if self.queued >= self.max_queue or user_queued >= self.max_per_user or expected_wait > self.max_wait:
+            self.shed += 1
+            return max(1.0, expected_wait)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name=f'admission-{self.name}')
+        await future
+        return None
+
+    async def _dispatch(self):
+        while self.queued:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            user_id, futures = next(iter(self.waiters.items()))
+            future = futures.popleft()
+            self.queued -= 1
+            if futures:
+                self.waiters.move_to_end(user_id)
+            else:
+                del self.waiters[user_id]
+            if future.done():
+                continue
+            self.tokens -= 1
+            self.admitted += 1
+            future.set_result(None)
+
+    def metrics(self):
+        self._refill()
+        return {'tokens': self.tokens, 'queued': self.queued, 'admitted': self.admitted, 'shed': self.shed}
+
+class AdmissionController:
+    def __init__(self, limits):
+        self.lanes = {name: AdmissionLane(name, rate, burst) for name, (rate, burst) in limits.items()}
+
+    async def acquire(self, name: str, user_id: int):
+        if user_id in OWNER_IDS:
+            return None
+        return await self.lanes[name].acquire(user_id)
+
+    def metrics(self):
+        return {name: lane.metrics() for name, lane in self.lanes.items()}
+
+admission = AdmissionController({
+    'getcredit': (ADMISSION_GETCREDIT_RATE, ADMISSION_GETCREDIT_BURST),
+    'getugphone': (ADMISSION_GETUGPHONE_RATE, ADMISSION_GETUGPHONE_BURST),
+    'redeem': (ADMISSION_REDEEM_RATE, ADMISSION_REDEEM_BURST),
+})
+
+# Function to tell a user their request was shed under load
+async def send_busy_message(interaction: discord.Interaction, retry_after: float):
+    embed = discord.Embed(
+        title="⏳ Hệ thống đang bận!",
+        description=f"Hiện có quá nhiều yêu cầu. Vui lòng thử lại sau **{int(retry_after + 0.999)} giây**.",
+        color=discord.Color.orange()
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+    logger.warning("Shed /%s from %s (ID: %s); retry in %.1fs.", interaction.command.name if interaction.command else 'interaction', interaction.user.display_name, interaction.user.id, retry_after, extra=LOG_SAMPLED)
+
+# Records a sanitised JSONL trace of interactions: command, options with free
+# text reduced to its length, a salted per-process user bucket instead of the
+# user ID, start time, duration and status. Entries are buffered and appended
+# from a worker thread every TRACE_FLUSH_INTERVAL seconds.
+class TraceRecorder:
+    def __init__(self, path=TRACE_FILE, user_buckets=TRACE_USER_BUCKETS, flush_interval=TRACE_FLUSH_INTERVAL):
+        self.path = path
+        self.enabled = bool(path)
+        self.user_buckets = max(1, user_buckets)
+        self.flush_interval = flush_interval
+        self._salt = os.urandom(16)
+        self._buffer = []
+        self._task = None
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            logger.info("Recording interaction trace to %s.", self.path)
+            self._task = asyncio.create_task(self._flusher(), name='trace-recorder')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def user_bucket(self, user_id: int) -> int:
+        digest = hashlib.blake2b(str(user_id).encode(), key=self._salt, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.user_buckets
+
+    def sanitize_options(self, interaction: discord.Interaction) -> dict:
+        command = interaction.command
+        params = {param.name: param for param in getattr(command, 'parameters', [])}
+        options = {}
+        for option in (interaction.data or {}).get('options', []):
+            name, option_type, value = option['name'], option['type'], option.get('value')
+            param = params.get(name)
+            if option_type == discord.AppCommandOptionType.string.value:
+                if param is not None and any(choice.value == value for choice in param.choices):
+                    options[name] = value
+                else:
+                    options[name] = {'len': len(value)}
+            elif option_type in (discord.AppCommandOptionType.integer.value, discord.AppCommandOptionType.number.value, discord.AppCommandOptionType.boolean.value):
+                options[name] = value
+            elif option_type in (discord.AppCommandOptionType.user.value, discord.AppCommandOptionType.mentionable.value):
+                options[name] = {'user': self.user_bucket(int(value))}
+            else:
+                options[name] = {'type': option_type}
+        return options
+
+    def record(self, command: str, options: dict, user_id: int, wall_started: float, seconds: float, status: str):
+        if not self.enabled:
+            return
+        self._buffer.append({
+            'ts': round(wall_started, 4),
+            'command': command,
+            'options': options,
+            'user': self.user_bucket(user_id),
+            'duration_ms': round(seconds * 1000, 3),
+            'status': status,
+        })
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        entries, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._append, entries)
+        except OSError as e:
+            logger.error("Could not write %s trace entries to %s: %s", len(entries), self.path, e)
+
+    def _append(self, entries):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + "\n" for entry in entries)
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+trace_recorder = TraceRecorder()
+
+# Structured per-command completion record (command, user_id, latency_ms, status in JSON logs)
+def log_command_finished(command: str, user_id: int, seconds: float, status: str):
+    latency_ms = round(seconds * 1000, 3)
+    logger.info("/%s by %s finished in %.1f ms (%s)", command, user_id, latency_ms, status,
+                extra={'command': command, 'user_id': user_id, 'latency_ms': latency_ms, 'status': status})
+
+# Times every slash command through the tree's public hooks instead of in each
+# command: interaction_check starts the clock, and on_app_command_completion or
+# the tree error handler stops it via finish_command_instrumentation().
+# Autocomplete requests also pass interaction_check but are not commands, so they are skipped.
+class InstrumentedCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.type is discord.InteractionType.application_command:
+            name = interaction.data.get('name', 'unknown') if interaction.data else 'interaction'
+            interaction.extras['instrumentation'] = (time.perf_counter(), time.time())
+            loop_watchdog.label_current_task(f"/{name}")
+            # The command runs in its own task, so the context ends with it
+            log_context.set((name, interaction.user.id))
+        return True
+
+# Record latency, the completion log line and the trace entry for a command started by interaction_check
+def finish_command_instrumentation(interaction: discord.Interaction, status: str):
+    timing = interaction.extras.pop('instrumentation', None)
+    if timing is None:
+        return
+    started, wall_started = timing
+    elapsed = time.perf_counter() - started
+    command = interaction.command.qualified_name if interaction.command else 'unknown'
+    COMMAND_LATENCY.observe(elapsed, command, status)
+    log_command_finished(command, interaction.user.id, elapsed, status)
+    if trace_recorder.enabled:
+        trace_recorder.record(command, trace_recorder.sanitize_options(interaction), interaction.user.id, wall_started, elapsed, status)
+
+# Function to categorise an app command error the same way on_app_command_error does
+def app_command_error_category(error: app_commands.AppCommandError) -> str:
+    if isinstance(error, app_commands.CommandInvokeError):
+        return 'invoke'
+    if isinstance(error, app_commands.CommandOnCooldown):
+        return 'cooldown'
+    if isinstance(error, app_commands.CheckFailure):
+        return 'check'
+    return 'unknown'
+
+def _collected(lines, name, documentation, samples, kind='gauge'):
+    lines.append(f"# HELP {name} {documentation}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+
+# Function to render every metric, collecting gauges from the running components
+async def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    write = db.write_metrics()
+    _collected(lines, 'bot_db_write_batches_total', 'Group commits since start.', [({}, write['batches'])], kind='counter')
+    _collected(lines, 'bot_db_write_ops_total', 'Write operations committed since start.', [({}, write['ops'])], kind='counter')
+    _collected(lines, 'bot_db_write_avg_batch_size', 'Average operations per group commit.', [({}, write['avg_batch_size'])])
+    _collected(lines, 'bot_db_commit_p99_seconds', 'p99 group commit time over recent batches.', [({}, write['p99_commit_ms'] / 1000)])
+    _collected(lines, 'bot_db_write_queue_depth', 'Writes waiting for the writer thread.', [({}, write['queue_depth'])])
+    _collected(lines, 'bot_db_read_queue_depth', 'Reads waiting for a pooled connection.', [({}, db.read_queue_depth())])
+    default_executor = getattr(asyncio.get_running_loop(), '_default_executor', None)
+    _collected(lines, 'bot_default_executor_queue_depth', 'Jobs waiting in the event loop default executor.',
+           [({}, default_executor._work_queue.qsize() if default_executor is not None else 0)])
+    _collected(lines, 'bot_log_queue_depth', 'Log records waiting for the writer thread.', [({}, log_handler.queue.qsize())])
+    _collected(lines, 'bot_log_records_dropped_total', 'Log records dropped because the log queue was full.', [({}, log_handler.dropped)], kind='counter')
+    _collected(lines, 'bot_log_records_suppressed_total', 'Repeated warnings suppressed by log sampling.', [({}, log_sampler.suppressed_total)], kind='counter')
+
+    short = shortener.metrics()
+    _collected(lines, 'bot_shortener_calls_total', 'Shortener calls by result since start.', [
+        ({'result': 'success'}, short['successes']),
+        ({'result': 'failure'}, short['failures']),
+        ({'result': 'short_circuited'}, short['short_circuited']),
+    ], kind='counter')
+    _collected(lines, 'bot_shortener_breaker_open', 'Whether the shortener circuit breaker is open (half-open counts as open).',
+           [({}, 0 if short['state'] == 'closed' else 1)])
+
+    pool = credit_pool.metrics()
+    _collected(lines, 'bot_credit_pool_depth', 'Pre-minted /getcredit links ready to hand out.', [({}, pool['depth'])])
+    _collected(lines, 'bot_credit_pool_events_total', 'Credit pool events since start.', [
+        ({'event': name}, pool[name]) for name in ('minted', 'mint_failures', 'dispensed', 'misses')
+    ], kind='counter')
+
+    lanes = admission.metrics()
+    _collected(lines, 'bot_admission_queued', 'Requests waiting for admission.', [({'lane': name}, lane['queued']) for name, lane in lanes.items()])
+    _collected(lines, 'bot_admission_admitted_total', 'Requests admitted since start.', [({'lane': name}, lane['admitted']) for name, lane in lanes.items()], kind='counter')
+    _collected(lines, 'bot_admission_shed_total', 'Requests shed since start.', [({'lane': name}, lane['shed']) for name, lane in lanes.items()], kind='counter')
+
+    cache = balance_cache.metrics()
+    _collected(lines, 'bot_balance_cache_size', 'Balances held in the write-through cache.', [({}, cache['size'])])
+    _collected(lines, 'bot_balance_cache_lookups_total', 'Balance cache lookups since start.', [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])], kind='counter')
+
+    def count_inventory(conn):
+        return {
+            'ug_phones': conn.execute("SELECT COALESCE(MAX(slot), 0) FROM ug_phone_slots").fetchone()[0],
+            'ug_phone_leases': conn.execute("SELECT COUNT(*) FROM ug_phone_leases").fetchone()[0],
+            'redemption_codes': conn.execute("SELECT COUNT(*) FROM redemption_codes").fetchone()[0],
+            'hcoin_pastebin_links': conn.execute("SELECT COUNT(*) FROM hcoin_pastebin_links").fetchone()[0],
+            'quick_add_staging': conn.execute("SELECT COUNT(*) FROM ug_phone_staging").fetchone()[0],
+        }
+
+    inventory = await db.run_read(count_inventory)
+    _collected(lines, 'bot_inventory_items', 'Rows currently in each stock table.', [({'table': name}, value) for name, value in inventory.items()])
+    return "\n".join(lines) + "\n"
+
+# Serves GET /metrics on METRICS_HOST:METRICS_PORT
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error("Could not start metrics endpoint on %s:%s: %s", self.host, self.port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info("Metrics endpoint listening on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        body = await render_metrics()
+        return web.Response(text=body, content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+metrics_server = MetricsServer()
+
+# Measures event-loop lag with a heartbeat task. A separate thread watches the
+# heartbeat: once it is overdue by more than the stall threshold, the thread
+# snapshots the loop thread's stack while the blocking code is still running,
+# along with the label of the task that holds the loop (slash command or event
+# handler). The heartbeat task completes the record with the total lag when
+# the loop comes back, and keeps the last LOOP_STALL_HISTORY stalls.
+class LoopWatchdog:
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold_ms=LOOP_STALL_THRESHOLD_MS, history=LOOP_STALL_HISTORY):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.stalls = deque(maxlen=history)
+        self.max_lag = 0.0
+        self._labels = weakref.WeakKeyDictionary()
+        self._beat = time.monotonic()
+        self._pending = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def label_current_task(self, label: str):
+        task = asyncio.current_task()
+        if task is not None:
+            self._labels[task] = label
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name='loop-watchdog-heartbeat')
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def _current_label(self):
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return 'unknown'
+        if task is None:
+            return 'event loop callback'
+        return self._labels.get(task) or task.get_name()
 
-# Function to get user hcoin balance
-def get_user_hcoin(user_id: int) -> int:
-    cursor = db.get_cursor()
-    cursor.execute("SELECT hcoin_balance FROM user_balances WHERE user_id = ?", (user_id,))
-    result = cursor.fetchone()
-    return result[0] if result else 0
-
-# Function to update user hcoin balance
-def update_user_hcoin(user_id: int, amount: int):
-    cursor = db.get_cursor()
-    cursor.execute("INSERT OR REPLACE INTO user_balances (user_id, hcoin_balance) VALUES (?, COALESCE((SELECT hcoin_balance FROM user_balances WHERE user_id = ?), 0) + ?)", (user_id, user_id, amount))
-    db.commit()
-
-# Function to deduplicate ug_phones data
-def deduplicate_ug_phones_data():
-    cursor = db.get_cursor()
-    cursor.execute("SELECT COUNT(*) FROM ug_phones")
-    initial_count = cursor.fetchone()[0]
-    cursor.execute('''
-        CREATE TEMPORARY TABLE IF NOT EXISTS ug_phones_temp AS
-        SELECT MIN(id) as id, data_json
-        FROM ug_phones
-        GROUP BY data_json;
-    ''')
-    cursor.execute('DELETE FROM ug_phones;')
-    cursor.execute('INSERT INTO ug_phones SELECT id, data_json FROM ug_phones_temp;')
-    cursor.execute('DROP TABLE IF EXISTS ug_phones_temp;')
-    cursor.execute("SELECT COUNT(*) FROM ug_phones")
-    final_count = cursor.fetchone()[0]
-    db.commit()
-    return initial_count, final_count
+    def _watch(self):
+        while not self._stop_event.wait(self.interval):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self._pending = {
+                'at': time.time() - overdue,
+                'handler': self._current_label(),
+                'stack': ''.join(traceback.format_stack(frame, limit=12)) if frame is not None else '',
+            }
 
-# Function to generate web link with random code
-def create_web_generator_link(code: str):
-    web_link = f"{WEB_GENERATOR_BASE_URL}{code}"
-    logger.info(f"Generated web link for code {code}: {web_link}")
-    return web_link
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._beat - self.interval)
+            EVENT_LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            pending, self._pending = self._pending, None
+            if lag < self.threshold:
+                continue
+            stall = pending or {'at': time.time() - lag, 'handler': 'unknown', 'stack': ''}
+            stall['lag_ms'] = lag * 1000
+            self.stalls.append(stall)
+            logger.warning("Event loop stalled for %.0f ms in %s.", stall['lag_ms'], stall['handler'])
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-def create_short_link(long_url: str):
-    if not YEUMONEY_API_TOKEN:
-        logger.error("Error: YEUMONEY_API_TOKEN is not set in environment variables.")
-        return None
-    api_url = "https://yeumoney.com/QL_api.php"
-    params = {
-        "token": YEUMONEY_API_TOKEN,
-        "url": long_url,
-        "format": "json"
-    }
-    try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
-        result = response.json()
-        if result.get("status") == "success" and "shortenedUrl" in result:
-            logger.info(f"Successfully created short link: {result['shortenedUrl']}")
-            return result["shortenedUrl"]
-        else:
-            error_message = result.get("message", "Unknown API error.")
-            logger.error(f"Error creating short link on Yeumoney.com. API response: {result}. Error: {error_message}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error connecting to Yeumoney.com API: {e}")
-        return None
-    except json.JSONDecodeError:
-        logger.error(f"Error decoding JSON from Yeumoney.com API response: {response.text}")
-        return None
+loop_watchdog = LoopWatchdog()
 
 class MyBot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix='!', intents=intents)
+        super().__init__(command_prefix='!', intents=intents, tree_cls=InstrumentedCommandTree)
         self.quick_add_ug_sessions = quick_add_ug_sessions
+        self.startup_timings = {}
+        self.valid_owner_ids = set()
+        self._startup_started = None
+        self._connect_started = None
+        self._ready_once = False
 
     async def setup_hook(self):
+        self._startup_started = time.perf_counter()
+        phase_started = self._startup_started
+        old_version, new_version = await db.run_write(migrate_db)
+        if old_version != new_version:
+            logger.info("Database schema migrated from version %s to %s.", old_version, new_version)
+        else:
+            logger.info("Database schema is up to date (version %s).", new_version)
+        self.startup_timings['migrations'] = time.perf_counter() - phase_started
+        await quick_add_staging.load()
+        credit_pool.start()
+        ug_phone_leases.start()
+        quick_add_staging.start()
+        hcoin_ledger_compactor.start()
+        await metrics_server.start()
+        loop_watchdog.start()
+        trace_recorder.start()
+        phase_started = time.perf_counter()
+        await self.sync_slash_commands()
+        self.startup_timings['command_sync'] = time.perf_counter() - phase_started
+        self._connect_started = time.perf_counter()
+
+    async def sync_slash_commands(self):
         if TEST_GUILD_ID:
             try:
                 test_guild_id_int = int(TEST_GUILD_ID)
                 test_guild = discord.Object(id=test_guild_id_int)
                 self.tree.copy_global_to(guild=test_guild)
                 await self.tree.sync(guild=test_guild)
-                logger.info(f'Slash commands synced for TEST_GUILD_ID: {test_guild_id_int} (instant sync)! Old commands removed.')
+                logger.info("Slash commands synced for TEST_GUILD_ID: %s (instant sync)! Old commands removed.", test_guild_id_int)
             except ValueError:
-                logger.error(f"ERROR: Invalid TEST_GUILD_ID '{TEST_GUILD_ID}' in .env. Falling back to global sync.")
+                logger.error("ERROR: Invalid TEST_GUILD_ID '%s' in .env. Falling back to global sync.", TEST_GUILD_ID)
                 await self.tree.sync()
                 logger.info('Slash commands synced globally (may take up to 1 hour to appear). Old commands removed.')
             except Exception as e:
-                logger.error(f"ERROR syncing to specific guild {TEST_GUILD_ID}: {e}. Falling back to global sync.")
+                logger.error("ERROR syncing to specific guild %s: %s. Falling back to global sync.", TEST_GUILD_ID, e)
                 await self.tree.sync()
                 logger.info('Slash commands synced globally (may take up to 1 hour to appear). Old commands removed.')
         else:
             await self.tree.sync()
             logger.info('Slash commands synced globally (may take up to 1 hour to appear). Old commands removed.')
 
-    async def on_ready(self):
-        logger.info(f'Logged in as {self.user}!')
-        logger.info(f'Bot ID: {self.user.id}')
-        for owner_id in OWNER_IDS:
-            try:
+    async def close(self):
+        await trace_recorder.stop()
+        await loop_watchdog.stop()
+        await metrics_server.stop()
+        await credit_pool.stop()
+        await ug_phone_leases.stop()
+        await quick_add_staging.stop()
+        await user_names.stop()
+        await hcoin_ledger_compactor.stop()
+        await super().close()
+        await shortener.close()
+        await asyncio.to_thread(db.close)
+
+    async def _validate_owner(self, owner_id):
+        owner = self.get_user(owner_id)
+        try:
+            if owner is None:
                 owner = await self.fetch_user(owner_id)
-                logger.info(f"Owner ID {owner_id} is valid (User: {owner.display_name}).")
-            except discord.NotFound:
-                logger.error(f"Owner ID {owner_id} is invalid or not found.")
-        await self.loop.run_in_executor(None, init_db)
-        logger.info("Database initialized or checked.")
-
-    async def on_tree_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
-        if isinstance(error, app_commands.CommandInvokeError):
-            logger.error(f"CommandInvokeError in command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error.original}")
-            try:
-                await interaction.response.send_message(f"Đã xảy ra lỗi khi thực thi lệnh: `{error.original}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
-            except discord.InteractionResponded:
-                await interaction.followup.send(f"Đã xảy ra lỗi khi thực thi lệnh: `{error.original}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
-        elif isinstance(error, app_commands.CheckFailure):
-            logger.warning(f"CheckFailure for command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error}")
-            message = "Bạn không phải là chủ sở hữu bot!" if interaction.user.id not in OWNER_IDS else f"Lệnh này chỉ có thể được sử dụng trong kênh quản trị viên: <#{ALLOWED_ADMIN_CHANNEL_ID}>."
-            try:
-                await interaction.response.send_message(message, ephemeral=True)
-            except discord.InteractionResponded:
-                await interaction.followup.send(message, ephemeral=True)
-        else:
-            logger.critical(f"Unknown AppCommand Error in command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error}")
-            try:
-                await interaction.response.send_message(f"Đã xảy ra lỗi không mong muốn: `{error}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
-            except discord.InteractionResponded:
-                await interaction.followup.send(f"Đã xảy ra lỗi không mong muốn: `{error}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
+            self.valid_owner_ids.add(owner_id)
+            logger.info("Owner ID %s is valid (User: %s).", owner_id, owner.display_name)
+        except discord.NotFound:
+            logger.error("Owner ID %s is invalid or not found.", owner_id)
+        except discord.HTTPException as e:
+            logger.warning("Could not validate owner ID %s: %s", owner_id, e)
+
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        finish_command_instrumentation(interaction, 'ok')
+
+    async def on_ready(self):
+        # on_ready fires again after every gateway reconnect; the startup work only runs once.
+        if self._ready_once:
+            logger.info("Reconnected to the gateway as %s.", self.user)
+            return
+        self._ready_once = True
+        self.startup_timings['gateway_connect'] = time.perf_counter() - self._connect_started
+        logger.info("Logged in as %s!", self.user)
+        logger.info("Bot ID: %s", self.user.id)
+        phase_started = time.perf_counter()
+        await asyncio.gather(*(self._validate_owner(owner_id) for owner_id in OWNER_IDS if owner_id not in self.valid_owner_ids))
+        self.startup_timings['owner_validation'] = time.perf_counter() - phase_started
+        self.startup_timings['total'] = time.perf_counter() - self._startup_started
+        logger.info("Startup timings: %s", ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in self.startup_timings.items()))
 
 bot = MyBot()
 
@@ -237,7 +2468,7 @@ bot = MyBot()
 def is_owner(interaction: discord.Interaction) -> bool:
     is_owner = interaction.user.id in OWNER_IDS
     if not is_owner:
-        logger.warning(f"User {interaction.user.display_name} (ID: {interaction.user.id}) attempted to use an owner command but is not an owner.")
+        logger.warning("User %s (ID: %s) attempted to use an owner command but is not an owner.", interaction.user.display_name, interaction.user.id, extra=LOG_SAMPLED)
     return is_owner
 
 # Modified check for admin channel (Owners bypass channel restriction)
@@ -245,21 +2476,26 @@ def is_allowed_admin_channel(interaction: discord.Interaction) -> bool:
     if interaction.user.id in OWNER_IDS:
         return True
     if interaction.channel.id != ALLOWED_ADMIN_CHANNEL_ID:
-        logger.warning(f"Command '{interaction.command.name}' attempted by {interaction.user.display_name} (ID: {interaction.user.id}) in unauthorized channel #{interaction.channel.name} (ID: {interaction.channel_id}).")
+        logger.warning("Command '%s' attempted by %s (ID: %s) in unauthorized channel #%s (ID: %s).", interaction.command.name, interaction.user.display_name, interaction.user.id, interaction.channel.name, interaction.channel_id, extra=LOG_SAMPLED)
     return interaction.channel.id == ALLOWED_ADMIN_CHANNEL_ID
 
 @bot.event
 async def on_message(message: discord.Message):
     if message.author.id == bot.user.id:
         return
+    loop_watchdog.label_current_task('on_message')
     user_id = message.author.id
-    content = message.content.strip()
     if user_id in bot.quick_add_ug_sessions:
+        content = message.content.strip()
         lower_content = content.lower()
-        if lower_content in ["done", "xong", "hoàn tất"]:
-            collected_data = bot.quick_add_ug_sessions.pop(user_id)
-            logger.info(f"User {message.author.display_name} (ID: {user_id}) ended /quickaddug session. Collected {len(collected_data)} items.")
-            if not collected_data:
+        if not quick_add_staging.is_active(user_id):
+            await quick_add_staging.cancel(user_id)
+            logger.info("/quickaddug session of %s (ID: %s) has expired.", message.author.display_name, user_id)
+            await message.channel.send(embed=build_quick_add_expired_embed())
+        elif lower_content in ["done", "xong", "hoàn tất"]:
+            staged_count, added_count = await quick_add_staging.commit(user_id)
+            logger.info("User %s (ID: %s) ended /quickaddug session. Collected %s items.", message.author.display_name, user_id, staged_count)
+            if not staged_count:
                 embed = discord.Embed(
                     title="ℹ️ Phiên kết thúc!",
                     description="Bạn đã kết thúc phiên nhưng không có Local Storage nào được gửi.",
@@ -267,33 +2503,10 @@ async def on_message(message: discord.Message):
                 )
                 await message.channel.send(embed=embed)
             else:
-                cursor = db.get_cursor()
-                added_count = 0
-                skipped_count = 0
-                error_count = 0
-                for data_item in collected_data:
-                    try:
-                        json.loads(data_item)
-                        cursor.execute("INSERT OR IGNORE INTO ug_phones (data_json) VALUES (?)", (data_item,))
-                        if cursor.rowcount > 0:
-                            added_count += 1
-                        else:
-                            skipped_count += 1
-                    except json.JSONDecodeError:
-                        error_count += 1
-                        logger.error(f"Invalid JSON in Local Storage data for user {user_id}: {data_item[:50]}...")
-                    except sqlite3.Error as e:
-                        error_count += 1
-                        logger.error(f"SQLite Error adding Local Storage data for user {user_id}: {e}")
-                    except Exception as e:
-                        error_count += 1
-                        logger.error(f"Unexpected error adding Local Storage data for user {user_id}: {e}")
-                db.commit()
+                skipped_count = staged_count - added_count
                 description = f"**{added_count}** Local Storage đã được thêm thành công vào kho.\n"
                 if skipped_count > 0:
                     description += f"**{skipped_count}** Local Storage bị bỏ qua (đã tồn tại).\n"
-                if error_count > 0:
-                    description += f"**{error_count}** Local Storage gặp lỗi khi thêm (dữ liệu không phải JSON hoặc lỗi khác). Vui lòng kiểm tra console bot."
                 embed = discord.Embed(
                     title="✅ Phiên Thêm Nhanh Local Storage Hoàn Tất!",
                     description=description,
@@ -302,48 +2515,58 @@ async def on_message(message: discord.Message):
                 embed.set_footer(text="Phiên đã kết thúc. Bạn có thể dùng /list localstorage để xem.")
                 await message.channel.send(embed=embed)
         elif lower_content == "cancel":
-            if user_id in bot.quick_add_ug_sessions:
-                bot.quick_add_ug_sessions.pop(user_id)
-                logger.info(f"User {message.author.display_name} (ID: {user_id}) cancelled /quickaddug session.")
-                embed = discord.Embed(
-                    title="❌ Phiên Thêm Nhanh Local Storage đã Hủy!",
-                    description="Phiên nhập Local Storage của bạn đã bị hủy bỏ. Không có dữ liệu nào được lưu.",
-                    color=discord.Color.red()
-                )
-                await message.channel.send(embed=embed)
+            await quick_add_staging.cancel(user_id)
+            logger.info("User %s (ID: %s) cancelled /quickaddug session.", message.author.display_name, user_id)
+            embed = discord.Embed(
+                title="❌ Phiên Thêm Nhanh Local Storage đã Hủy!",
+                description="Phiên nhập Local Storage của bạn đã bị hủy bỏ. Không có dữ liệu nào được lưu.",
+                color=discord.Color.red()
+            )
+            await message.channel.send(embed=embed)
         else:
-            try:
-                json.loads(content)
-                bot.quick_add_ug_sessions[user_id].append(content)
-                logger.debug(f"User {message.author.display_name} (ID: {user_id}) added valid JSON to /quickaddug session: {content[:50]}...")
-                await message.add_reaction("✅")
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON from {message.author.display_name} (ID: {user_id}) in /quickaddug session.")
-                await message.add_reaction("❌")
-                await message.channel.send(embed=discord.Embed(
-                    title="❌ Dữ liệu không hợp lệ!",
-                    description="Vui lòng gửi dữ liệu Local Storage dạng JSON hợp lệ.",
-                    color=discord.Color.red()
-                ), ephemeral=True)
+            status = await quick_add_staging.stage(user_id, content)
+            if status == 'staged':
+                logger.debug("User %s (ID: %s) added valid JSON to /quickaddug session: %s...", message.author.display_name, user_id, content[:50])
+                quick_add_staging.acknowledge(message, True)
+            elif status == 'expired':
+                logger.info("/quickaddug session of %s (ID: %s) has expired.", message.author.display_name, user_id)
+                await message.channel.send(embed=build_quick_add_expired_embed())
+            else:
+                logger.warning("Rejected message from %s (ID: %s) in /quickaddug session (%s).", message.author.display_name, user_id, status, extra=LOG_SAMPLED)
+                quick_add_staging.acknowledge(message, False)
     await bot.process_commands(message)
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    COMMAND_ERRORS.inc(interaction.command.qualified_name if interaction.command else 'unknown', app_command_error_category(error))
+    try:
+        await reply_app_command_error(interaction, error)
+    finally:
+        finish_command_instrumentation(interaction, 'error')
+
+# Function to log an app command error and tell the user what went wrong
+async def reply_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     if isinstance(error, app_commands.CommandInvokeError):
-        logger.error(f"CommandInvokeError in command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error.original}")
+        logger.error("CommandInvokeError in command '%s' by %s (ID: %s) in channel %s (ID: %s): %s", interaction.command.name, interaction.user.display_name, interaction.user.id, interaction.channel, interaction.channel_id, error.original)
         try:
             await interaction.response.send_message(f"Đã xảy ra lỗi khi thực thi lệnh: `{error.original}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
         except discord.InteractionResponded:
             await interaction.followup.send(f"Đã xảy ra lỗi khi thực thi lệnh: `{error.original}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
+    elif isinstance(error, app_commands.CommandOnCooldown):
+        message = f"Bạn đang dùng lệnh này quá nhanh. Vui lòng thử lại sau **{int(error.retry_after + 0.999)} giây**."
+        try:
+            await interaction.response.send_message(message, ephemeral=True)
+        except discord.InteractionResponded:
+            await interaction.followup.send(message, ephemeral=True)
     elif isinstance(error, app_commands.CheckFailure):
-        logger.warning(f"CheckFailure for command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error}")
+        logger.warning("CheckFailure for command '%s' by %s (ID: %s) in channel %s (ID: %s): %s", interaction.command.name, interaction.user.display_name, interaction.user.id, interaction.channel, interaction.channel_id, error, extra=LOG_SAMPLED)
         message = "Bạn không phải là chủ sở hữu bot!" if interaction.user.id not in OWNER_IDS else f"Lệnh này chỉ có thể được sử dụng trong kênh quản trị viên: <#{ALLOWED_ADMIN_CHANNEL_ID}>."
         try:
             await interaction.response.send_message(message, ephemeral=True)
         except discord.InteractionResponded:
             await interaction.followup.send(message, ephemeral=True)
     else:
-        logger.critical(f"Unknown AppCommand Error in command '{interaction.command.name}' by {interaction.user.display_name} (ID: {interaction.user.id}) in channel {interaction.channel} (ID: {interaction.channel_id}): {error}")
+        logger.critical("Unknown AppCommand Error in command '%s' by %s (ID: %s) in channel %s (ID: %s): %s", interaction.command.name, interaction.user.display_name, interaction.user.id, interaction.channel, interaction.channel_id, error)
         try:
             await interaction.response.send_message(f"Đã xảy ra lỗi không mong muốn: `{error}`. Vui lòng liên hệ quản trị viên.", ephemeral=True)
         except discord.InteractionResponded:
@@ -354,36 +2577,22 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 async def get_credit(interaction: discord.Interaction):
     user_id = interaction.user.id
     await interaction.response.defer(ephemeral=True)
-    generated_code = generate_random_code(20)
-    logger.info(f"User {interaction.user.display_name} (ID: {user_id}) requested /getcredit. Generated code: {generated_code}")
-    web_link = await bot.loop.run_in_executor(None, create_web_generator_link, generated_code)
-    if not web_link:
-        embed = discord.Embed(
-            title="❌ Không thể tạo liên kết!",
-            description='Không thể tạo liên kết web cho mã của bạn. Vui lòng thử lại sau hoặc liên hệ quản trị viên.',
-            color=discord.Color.red()
-        )
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.error(f"Failed to create web link for user {user_id}'s /getcredit request.")
+    logger.info("User %s (ID: %s) requested /getcredit.", interaction.user.display_name, user_id)
+    retry_after = await admission.acquire('getcredit', user_id)
+    if retry_after is not None:
+        await send_busy_message(interaction, retry_after)
         return
-    cursor = db.get_cursor()
     try:
-        cursor.execute("INSERT INTO redemption_codes (code) VALUES (?)", (generated_code,))
-        db.commit()
-        logger.info(f"Code {generated_code} saved to DB for user {user_id}.")
-    except sqlite3.IntegrityError:
-        db.commit()
-        embed = discord.Embed(
-            title="❌ Lỗi tạo mã!",
-            description='Không thể tạo mã duy nhất. Vui lòng thử lại.',
-            color=discord.Color.red()
-        )
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.error(f"IntegrityError: Generated code {generated_code} already exists in DB for user {user_id}.")
-        return
-    short_link = await bot.loop.run_in_executor(None, create_short_link, web_link)
-    if short_link:
-        logger.info(f"User {user_id} used /getcredit. Short link: {short_link}")
+        entry = await credit_pool.pop()
+        if entry is None:
+            logger.warning("Credit link pool is empty; minting a link inline for user %s.", user_id)
+            entry = await credit_pool.mint_direct()
+    except sqlite3.Error as e:
+        logger.error("SQLite Error handing out a code for user %s's /getcredit request: %s", user_id, e)
+        entry = None
+    if entry:
+        generated_code, short_link = entry
+        logger.info("User %s used /getcredit. Code %s, short link: %s", user_id, generated_code, short_link)
         embed = discord.Embed(
             title="✨ Liên kết mã mới của bạn! ✨",
             description=f"Xin chào **{interaction.user.display_name}**! Đây là liên kết mã duy nhất mới của bạn. "
@@ -395,12 +2604,10 @@ async def get_credit(interaction: discord.Interaction):
         embed.timestamp = discord.utils.utcnow()
         await interaction.followup.send(embed=embed, ephemeral=True)
     else:
-        cursor.execute("DELETE FROM redemption_codes WHERE code = ?", (generated_code,))
-        db.commit()
-        logger.error(f"Failed to create short link for web link {web_link}. Deleted code {generated_code} from DB.")
+        logger.error("Failed to provide a short link for user %s's /getcredit request.", user_id)
         embed = discord.Embed(
             title="❌ Không thể tạo liên kết!",
-            description='Không thể tạo liên kết rút gọn vào lúc này. Mã đã tạo đã bị xóa. Vui lòng thử lại sau.',
+            description='Không thể tạo liên kết rút gọn vào lúc này. Vui lòng thử lại sau.',
             color=discord.Color.red()
         )
         await interaction.followup.send(embed=embed, ephemeral=True)
@@ -410,17 +2617,15 @@ async def get_credit(interaction: discord.Interaction):
 @app_commands.check(is_allowed_admin_channel)
 @app_commands.describe(code='The code you want to remove (e.g., ABCDE12345)')
 async def remove_code(interaction: discord.Interaction, code: str):
-    cursor = db.get_cursor()
-    cursor.execute("DELETE FROM redemption_codes WHERE code = ?", (code,))
-    db.commit()
-    if cursor.rowcount > 0:
+    removed = await db.execute("DELETE FROM redemption_codes WHERE code = ?", (code,))
+    if removed > 0:
         embed = discord.Embed(
             title="✅ Mã đã xóa thành công!",
             description=f'Mã `{code}` đã được xóa thành công.',
             color=discord.Color.green()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.info(f"Code {code} removed by {interaction.user.display_name} (ID: {interaction.user.id}).")
+        logger.info("Code %s removed by %s (ID: %s).", code, interaction.user.display_name, interaction.user.id)
     else:
         embed = discord.Embed(
             title="❌ Không tìm thấy mã!",
@@ -428,7 +2633,7 @@ async def remove_code(interaction: discord.Interaction, code: str):
             color=discord.Color.red()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.warning(f"Attempt to remove non-existent code {code} by {interaction.user.display_name} (ID: {interaction.user.id}).")
+        logger.warning("Attempt to remove non-existent code %s by %s (ID: %s).", code, interaction.user.display_name, interaction.user.id)
 
 class RedeemMultipleCodesModal(ui.Modal, title='Đổi Nhiều Mã'):
     codes_input = ui.TextInput(
@@ -438,13 +2643,30 @@ class RedeemMultipleCodesModal(ui.Modal, title='Đổi Nhiều Mã'):
         max_length=4000
     )
 
+    # Modal submits bypass the command tree, so this is traced here
     async def on_submit(self, interaction: discord.Interaction):
+        started = time.perf_counter()
+        wall_started = time.time()
+        context_token = log_context.set(('redeem_modal', interaction.user.id))
+        status = 'ok'
+        try:
+            await self.redeem_submitted(interaction)
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            codes = sum(1 for line in self.codes_input.value.split('\n') if line.strip())
+            trace_recorder.record('redeem_modal', {'codes': codes}, interaction.user.id, wall_started, elapsed, status)
+            log_command_finished('redeem_modal', interaction.user.id, elapsed, status)
+            log_context.reset(context_token)
+
+    async def redeem_submitted(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         user_id = interaction.user.id
-        hcoin_per_code = 150
         raw_codes_input = self.codes_input.value
         codes_to_redeem = [code.strip() for code in raw_codes_input.split('\n') if code.strip()]
-        logger.info(f"User {interaction.user.display_name} (ID: {user_id}) submitted {len(codes_to_redeem)} codes via quickredeemmodal.")
+        logger.info("User %s (ID: %s) submitted %s codes via quickredeemmodal.", interaction.user.display_name, user_id, len(codes_to_redeem))
         if not codes_to_redeem:
             embed = discord.Embed(
                 title="⚠️ Không có mã nào được cung cấp!",
@@ -453,41 +2675,31 @@ class RedeemMultipleCodesModal(ui.Modal, title='Đổi Nhiều Mã'):
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
             return
-        cursor = db.get_cursor()
-        redeemed_count = 0
-        invalid_count = 0
-        total_hcoin_earned = 0
-        failed_codes = []
-        for code in codes_to_redeem:
-            try:
-                cursor.execute("SELECT code FROM redemption_codes WHERE code = ?", (code,))
-                existing_code = cursor.fetchone()
-                if existing_code:
-                    cursor.execute("DELETE FROM redemption_codes WHERE code = ?", (code,))
-                    redeemed_count += 1
-                    total_hcoin_earned += hcoin_per_code
-                else:
-                    invalid_count += 1
-                    failed_codes.append(code)
-            except sqlite3.Error as e:
-                logger.error(f"SQLite Error processing code '{code}' for redemption by {user_id}: {e}")
-                invalid_count += 1
-                failed_codes.append(code)
-            except Exception as e:
-                logger.error(f"Unexpected error processing code '{code}' for redemption by {user_id}: {e}")
-                invalid_count += 1
-                failed_codes.append(code)
-        db.commit()
-        if total_hcoin_earned > 0:
-            await bot.loop.run_in_executor(None, update_user_hcoin, user_id, total_hcoin_earned)
-        current_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user_id)
+        retry_after = await admission.acquire('redeem', user_id)
+        if retry_after is not None:
+            await send_busy_message(interaction, retry_after)
+            return
+        try:
+            redeemed_codes, failed_codes, current_balance = await redeem_codes(user_id, codes_to_redeem)
+        except sqlite3.Error as e:
+            logger.error("SQLite Error during bulk redemption of %s codes by %s: %s", len(codes_to_redeem), user_id, e)
+            embed = discord.Embed(
+                title="❌ Lỗi!",
+                description='Đã xảy ra lỗi khi đổi mã của bạn. Vui lòng thử lại sau.',
+                color=discord.Color.red()
+            )
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        redeemed_count = len(redeemed_codes)
+        invalid_count = len(failed_codes)
+        total_hcoin_earned = redeemed_count * HCOIN_PER_CODE
         title = "✨ Kết Quả Đổi Mã ✨"
         color = discord.Color.green() if redeemed_count > 0 else discord.Color.orange()
         description_parts = []
         if redeemed_count > 0:
             description_parts.append(f"✅ Đã đổi thành công **{redeemed_count}** mã.")
             description_parts.append(f"Bạn nhận được tổng cộng **{total_hcoin_earned} coin**.")
-            logger.info(f"User {interaction.user.display_name} (ID: {user_id}) redeemed {redeemed_count} codes for {total_hcoin_earned} coins. New balance: {current_balance}.")
+            logger.info("User %s (ID: %s) redeemed %s codes for %s coins. New balance: %s.", interaction.user.display_name, user_id, redeemed_count, total_hcoin_earned, current_balance)
         if invalid_count > 0:
             description_parts.append(f"❌ **{invalid_count}** mã không hợp lệ hoặc đã được sử dụng.")
             if failed_codes:
@@ -495,7 +2707,7 @@ class RedeemMultipleCodesModal(ui.Modal, title='Đổi Nhiều Mã'):
                 if len(failed_codes) > 10:
                     failed_codes_str += f", ...và {len(failed_codes) - 10} mã khác"
                 description_parts.append(f"Các mã không đổi được: `{failed_codes_str}`")
-            logger.warning(f"User {interaction.user.display_name} (ID: {user_id}) had {invalid_count} invalid/used codes. Failed codes: {', '.join(failed_codes)}.")
+            logger.warning("User %s (ID: %s) had %s invalid/used codes. Failed codes: %s.", interaction.user.display_name, user_id, invalid_count, ', '.join(failed_codes), extra=LOG_SAMPLED)
         description_parts.append(f"\n**Số Coin Hiện Tại:** **{current_balance} coin**")
         embed = discord.Embed(
             title=title,
@@ -512,16 +2724,14 @@ async def redeem_code(interaction: discord.Interaction, code: str = None):
     if code:
         await interaction.response.defer(ephemeral=True)
         user_id = interaction.user.id
-        hcoin_reward = 150
-        cursor = db.get_cursor()
+        hcoin_reward = HCOIN_PER_CODE
+        retry_after = await admission.acquire('redeem', user_id)
+        if retry_after is not None:
+            await send_busy_message(interaction, retry_after)
+            return
         try:
-            cursor.execute("SELECT code FROM redemption_codes WHERE code = ?", (code,))
-            existing_code = cursor.fetchone()
-            if existing_code:
-                cursor.execute("DELETE FROM redemption_codes WHERE code = ?", (code,))
-                db.commit()
-                await bot.loop.run_in_executor(None, update_user_hcoin, user_id, hcoin_reward)
-                current_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user_id)
+            redeemed_codes, _, current_balance = await redeem_codes(user_id, [code])
+            if redeemed_codes:
                 embed = discord.Embed(
                     title="✅ Đổi mã thành công!",
                     description=f'Bạn đã đổi mã `{code}` và nhận được **{hcoin_reward} coin**.',
@@ -529,7 +2739,7 @@ async def redeem_code(interaction: discord.Interaction, code: str = None):
                 )
                 embed.add_field(name="Số dư hiện tại", value=f"**{current_balance} coin**", inline=True)
                 await interaction.followup.send(embed=embed, ephemeral=False)
-                logger.info(f"User {interaction.user.display_name} (ID: {user_id}) redeemed code {code} for {hcoin_reward} coins. New balance: {current_balance}.")
+                logger.info("User %s (ID: %s) redeemed code %s for %s coins. New balance: %s.", interaction.user.display_name, user_id, code, hcoin_reward, current_balance)
             else:
                 embed = discord.Embed(
                     title="❌ Mã không hợp lệ!",
@@ -537,26 +2747,181 @@ async def redeem_code(interaction: discord.Interaction, code: str = None):
                     color=discord.Color.red()
                 )
                 await interaction.followup.send(embed=embed, ephemeral=True)
-                logger.warning(f"User {interaction.user.display_name} (ID: {user_id}) tried to redeem invalid/used code {code}.")
+                logger.warning("User %s (ID: %s) tried to redeem invalid/used code %s.", interaction.user.display_name, user_id, code, extra=LOG_SAMPLED)
         except sqlite3.Error as e:
-            logger.error(f"SQLite Error during /redeem for user {user_id}, code {code}: {e}")
+            logger.error("SQLite Error during /redeem for user %s, code %s: %s", user_id, code, e)
             embed = discord.Embed(
                 title="❌ Lỗi!",
                 description='Đã xảy ra lỗi khi đổi mã của bạn. Vui lòng thử lại sau.',
                 color=discord.Color.red()
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
-        finally:
-            db.commit()
     else:
-        logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /redeem without a code, showing modal.")
+        logger.info("User %s (ID: %s) used /redeem without a code, showing modal.", interaction.user.display_name, interaction.user.id)
         await interaction.response.send_modal(RedeemMultipleCodesModal())
 
 @bot.tree.command(name='quickredeemcode', description='Redeem multiple codes directly at once.')
 async def quick_redeem_code_command_modal(interaction: discord.Interaction):
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /quickredeemcode (modal).")
+    logger.info("User %s (ID: %s) used /quickredeemcode (modal).", interaction.user.display_name, interaction.user.id)
     await interaction.response.send_modal(RedeemMultipleCodesModal())
 
+# Sources for /list. Pages are read with keyset pagination (WHERE key > ? LIMIT n)
+# so every click costs one index range scan, whatever the table size.
+LIST_SOURCES = {
+    'code': {
+        'title': "📜 Danh sách mã",
+        'header': "**Danh sách các mã còn lại (dùng cho /redeem):**",
+        'empty': 'Không còn mã nào trong hệ thống.',
+        'table': 'redemption_codes',
+        'key': 'code',
+        'columns': 'code',
+        'key_type': str,
+        'page_size': 25,
+        'count_sql': None,
+        'format': lambda row: f"`{row[0]}`",
+    },
+    'link': {
+        'title': "📜 Danh sách liên kết Pastebin",
+        'header': "**Danh sách các liên kết Pastebin chưa sử dụng:**",
+        'empty': 'Hiện tại không có liên kết Pastebin nào trong danh sách.',
+        'table': 'hcoin_pastebin_links',
+        'key': 'id',
+        'columns': 'id, pastebin_url',
+        'key_type': int,
+        'page_size': 25,
+        'count_sql': None,
+        'format': lambda row: f"`{row[0]}.` <{row[1]}>",
+    },
+    'localstorage': {
+        'title': "📦 Kho Local Storage",
+        'header': "",
+        'empty': 'Hiện tại không có Local Storage nào trong kho.',
+        'table': 'ug_phones',
+        'key': 'id',
+        'columns': f'id, substr(data_json, 1, {LIST_PREVIEW_CHARS}), length(data_json)',
+        'key_type': int,
+        'page_size': 5,
+        'count_sql': "SELECT COALESCE(MAX(slot), 0) FROM ug_phone_slots",
+        'format': lambda row: f"**ID: `{row[0]}`**\n```json\n{row[1]}{'…' if row[2] > LIST_PREVIEW_CHARS else ''}\n```",
+    },
+}
+
+# Function to fetch one /list page. Returns (rows, has_prev, has_next).
+async def fetch_list_page(source, mode='first', key=None):
+    return await db.run_read(lambda conn: read_list_page(conn, source, mode, key))
+
+# Keyset-paginated read of one /list page on the given connection
+def read_list_page(conn, source, mode='first', key=None):
+    table, key_column, columns, page_size = source['table'], source['key'], source['columns'], source['page_size']
+    if mode == 'next':
+        rows = conn.execute(f"SELECT {columns} FROM {table} WHERE {key_column} > ? ORDER BY {key_column} LIMIT ?", (key, page_size + 1)).fetchall()
+        return rows[:page_size], True, len(rows) > page_size
+    if mode == 'prev':
+        rows = conn.execute(f"SELECT {columns} FROM {table} WHERE {key_column} < ? ORDER BY {key_column} DESC LIMIT ?", (key, page_size + 1)).fetchall()
+        return rows[:page_size][::-1], len(rows) > page_size, True
+    if mode == 'last':
+        rows = conn.execute(f"SELECT {columns} FROM {table} ORDER BY {key_column} DESC LIMIT ?", (page_size + 1,)).fetchall()
+        return rows[:page_size][::-1], len(rows) > page_size, False
+    if mode == 'jump':
+        rows = conn.execute(f"SELECT {columns} FROM {table} WHERE {key_column} >= ? ORDER BY {key_column} LIMIT ?", (key, page_size + 1)).fetchall()
+        has_prev = conn.execute(f"SELECT 1 FROM {table} WHERE {key_column} < ? LIMIT 1", (key,)).fetchone() is not None
+        return rows[:page_size], has_prev, len(rows) > page_size
+    rows = conn.execute(f"SELECT {columns} FROM {table} ORDER BY {key_column} LIMIT ?", (page_size + 1,)).fetchall()
+    return rows[:page_size], False, len(rows) > page_size
+
+class ListJumpModal(ui.Modal, title='Đi tới'):
+    start_key = ui.TextInput(label='Bắt đầu từ ID / mã', placeholder='Nhập ID hoặc mã để bắt đầu trang...', max_length=100)
+
+    def __init__(self, list_view):
+        super().__init__()
+        self.list_view = list_view
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            key = self.list_view.source['key_type'](self.start_key.value.strip())
+        except ValueError:
+            await interaction.response.send_message("Giá trị không hợp lệ. Vui lòng nhập một ID dạng số.", ephemeral=True)
+            return
+        await self.list_view.show(interaction, 'jump', key)
+
+class ListPaginatorView(ui.View):
+    def __init__(self, owner_id: int, list_type: str, total=None):
+        super().__init__(timeout=LIST_VIEW_TIMEOUT)
+        self.owner_id = owner_id
+        self.list_type = list_type
+        self.source = LIST_SOURCES[list_type]
+        self.total = total
+        self.page = 1
+        self.first_key = None
+        self.last_key = None
+        self.message = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    def build_embed(self, rows):
+        source = self.source
+        if not rows:
+            return discord.Embed(title=source['title'], description=source['empty'], color=discord.Color.blue())
+        lines = [source['header']] if source['header'] else []
+        lines.extend(source['format'](row) for row in rows)
+        embed = discord.Embed(title=source['title'], description="\n".join(lines)[:4096], color=discord.Color.blue())
+        footer = f"Trang {self.page}" if self.page else f"Từ {rows[0][0]}"
+        if self.total is not None:
+            footer += f" • Tổng số: {self.total}"
+        embed.set_footer(text=footer)
+        return embed
+
+    async def load(self, mode='first', key=None):
+        rows, has_prev, has_next = await fetch_list_page(self.source, mode, key)
+        if mode == 'first':
+            self.page = 1
+        elif mode in ('next', 'prev') and self.page:
+            self.page += 1 if mode == 'next' else -1
+        else:
+            self.page = None
+        if rows:
+            self.first_key = rows[0][0]
+            self.last_key = rows[-1][0]
+        self.first_button.disabled = not has_prev
+        self.prev_button.disabled = not has_prev
+        self.next_button.disabled = not has_next
+        self.last_button.disabled = not has_next
+        return self.build_embed(rows)
+
+    async def show(self, interaction: discord.Interaction, mode, key=None):
+        embed = await self.load(mode, key)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    @ui.button(emoji='⏮️', style=discord.ButtonStyle.secondary)
+    async def first_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, 'first')
+
+    @ui.button(emoji='◀️', style=discord.ButtonStyle.primary)
+    async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, 'prev', self.first_key)
+
+    @ui.button(emoji='▶️', style=discord.ButtonStyle.primary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, 'next', self.last_key)
+
+    @ui.button(emoji='⏭️', style=discord.ButtonStyle.secondary)
+    async def last_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, 'last')
+
+    @ui.button(emoji='🔎', label='Đi tới', style=discord.ButtonStyle.secondary)
+    async def jump_button(self, interaction: discord.Interaction, button: ui.Button):
+        await interaction.response.send_modal(ListJumpModal(self))
+
 @bot.tree.command(name='list', description='Display a list of codes, Pastebin links, or Local Storage data.')
 @app_commands.check(is_owner)
 @app_commands.check(is_allowed_admin_channel)
@@ -568,98 +2933,124 @@ async def quick_redeem_code_command_modal(interaction: discord.Interaction):
 ])
 async def list_items(interaction: discord.Interaction, type_to_list: app_commands.Choice[str]):
     await interaction.response.defer(ephemeral=True)
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /list {type_to_list.value}.")
-    cursor = db.get_cursor()
-    title = ""
-    color = discord.Color.blue()
-    items = []
-    if type_to_list.value == "code":
-        title = "📜 Danh sách mã"
-        cursor.execute("SELECT code FROM redemption_codes")
-        items = cursor.fetchall()
-        if not items:
-            description = 'Không còn mã nào trong hệ thống.'
-        else:
-            response_lines = ["**Danh sách các mã còn lại (dùng cho /redeem):**"]
-            for i, item_tuple in enumerate(items):
-                response_lines.append(f"`{i+1}.` `{item_tuple[0]}`")
-            description = "\n".join(response_lines)
-    elif type_to_list.value == "link":
-        title = "📜 Danh sách liên kết Pastebin"
-        cursor.execute("SELECT pastebin_url FROM hcoin_pastebin_links")
-        items = cursor.fetchall()
-        if not items:
-            description = 'Hiện tại không có liên kết Pastebin nào trong danh sách.'
-        else:
-            response_lines = ["**Danh sách các liên kết Pastebin chưa sử dụng:**"]
-            for i, item_tuple in enumerate(items):
-                response_lines.append(f"`{i+1}.` <{item_tuple[0]}>")
-            description = "\n".join(response_lines)
-    elif type_to_list.value == "localstorage":
-        title = "📦 Kho Local Storage"
-        cursor.execute("SELECT id, data_json FROM ug_phones")
-        items = cursor.fetchall()
-        if not items:
-            description = 'Hiện tại không có Local Storage nào trong kho.'
+    logger.info("User %s (ID: %s) used /list %s.", interaction.user.display_name, interaction.user.id, type_to_list.value)
+    source = LIST_SOURCES[type_to_list.value]
+    total = None
+    if source['count_sql']:
+        total = (await db.fetchone(source['count_sql']))[0]
+    view = ListPaginatorView(interaction.user.id, type_to_list.value, total)
+    embed = await view.load('first')
+    view.message = await interaction.followup.send(embed=embed, view=view, ephemeral=True, wait=True)
+
+# Columns written by /export for each /list source
+EXPORT_COLUMNS = {
+    'code': ['code'],
+    'link': ['id', 'pastebin_url'],
+    'localstorage': ['id', 'data_json'],
+}
+
+# Function to stream a table into gzip-compressed NDJSON/CSV files. Rows are read
+# in fixed-size keyset batches on a dedicated read-only connection, and a new
+# part is started whenever the compressed file nears max_bytes. Runs in a worker thread.
+def write_export_files(list_type: str, file_format: str, directory: str, max_bytes: int, batch_size: int = EXPORT_BATCH_SIZE):
+    source = LIST_SOURCES[list_type]
+    columns = EXPORT_COLUMNS[list_type]
+    table, key_column = source['table'], source['key']
+    key_index = columns.index(key_column)
+    paths = []
+    row_count = 0
+    raw = gz = text = writer = None
+
+    def open_part():
+        nonlocal raw, gz, text, writer
+        path = os.path.join(directory, f"{list_type}_export_part{len(paths) + 1}.{file_format}.gz")
+        paths.append(path)
+        raw = open(path, 'wb')
+        gz = gzip.GzipFile(fileobj=raw, mode='wb')
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        if file_format == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(columns)
+
+    def close_part():
+        text.close()
+        raw.close()
+
+    conn = db.connect_readonly()
+    try:
+        open_part()
+        last_key = None
+        while True:
+            if last_key is None:
+                batch = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {key_column} LIMIT ?", (batch_size,)).fetchall()
+            else:
+                batch = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {key_column} > ? ORDER BY {key_column} LIMIT ?", (last_key, batch_size)).fetchall()
+            if not batch:
+                break
+            for row in batch:
+                if raw.tell() >= max_bytes:
+                    close_part()
+                    open_part()
+                if file_format == 'csv':
+                    writer.writerow(row)
+                else:
+                    text.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                    text.write('\n')
+            row_count += len(batch)
+            last_key = batch[-1][key_index]
+        close_part()
+    finally:
+        conn.close()
+    return paths, row_count
+
+@bot.tree.command(name='export', description='Export codes, Pastebin links, or Local Storage as compressed file attachments.')
+@app_commands.check(is_owner)
+@app_commands.check(is_allowed_admin_channel)
+@app_commands.describe(type_to_export='Choose what to export.', file_format='File format inside the gzip archive.')
+@app_commands.choices(type_to_export=[
+    app_commands.Choice(name="Codes", value="code"),
+    app_commands.Choice(name="Pastebin Links", value="link"),
+    app_commands.Choice(name="Local Storage", value="localstorage")
+], file_format=[
+    app_commands.Choice(name="NDJSON", value="ndjson"),
+    app_commands.Choice(name="CSV", value="csv")
+])
+async def export_items(interaction: discord.Interaction, type_to_export: app_commands.Choice[str], file_format: app_commands.Choice[str] = None):
+    await interaction.response.defer(ephemeral=True)
+    fmt = file_format.value if file_format else 'ndjson'
+    logger.info("User %s (ID: %s) used /export %s (%s).", interaction.user.display_name, interaction.user.id, type_to_export.value, fmt)
+    # Leave headroom below the attachment limit for gzip data still buffered when a batch ends.
+    filesize_limit = interaction.guild.filesize_limit if interaction.guild else EXPORT_DEFAULT_FILESIZE_LIMIT
+    max_bytes = int(filesize_limit * 0.9)
+    with tempfile.TemporaryDirectory(prefix='export_') as directory:
+        try:
+            paths, row_count = await asyncio.to_thread(write_export_files, type_to_export.value, fmt, directory, max_bytes)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error exporting %s for %s: %s", type_to_export.value, interaction.user.display_name, e)
             embed = discord.Embed(
-                title=title,
-                description=description,
-                color=color
+                title="❌ Lỗi xuất dữ liệu!",
+                description=f'Đã xảy ra lỗi khi xuất dữ liệu: {e}',
+                color=discord.Color.red()
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
             return
-        formatted_items_lines = []
-        for item_id, item_content in items:
-            formatted_items_lines.append(f"**ID: `{item_id}`**\n```json\n{item_content}\n```")
-        if len("\n".join(formatted_items_lines)) > 4000:
-            await interaction.followup.send(embed=discord.Embed(
-                title=title,
-                description="Đang xử lý và gửi dữ liệu Local Storage. Điều này có thể cần nhiều tin nhắn.",
+        if not row_count:
+            embed = discord.Embed(
+                title="ℹ️ Không có dữ liệu!",
+                description=LIST_SOURCES[type_to_export.value]['empty'],
                 color=discord.Color.blue()
-            ), ephemeral=True)
-            logger.info(f"Sending large Local Storage list to {interaction.user.display_name} (ID: {interaction.user.id}) in multiple messages.")
-        current_embed_lines = []
-        current_embed_length = 0
-        max_embed_length = 3800
-        for line in formatted_items_lines:
-            line_length = len(line) + 1
-            if current_embed_length + line_length > max_embed_length:
-                embed_to_send = discord.Embed(
-                    title=title,
-                    description="\n".join(current_embed_lines),
-                    color=color
-                )
-                await interaction.followup.send(embed=embed_to_send, ephemeral=True)
-                current_embed_lines = []
-                current_embed_length = 0
-            current_embed_lines.append(line)
-            current_embed_length += line_length
-        if current_embed_lines:
-            embed_to_send = discord.Embed(
-                title=title,
-                description="\n".join(current_embed_lines),
-                color=color
             )
-            embed_to_send.set_footer(text=f"Tổng số {type_to_list.name.lower()}: {len(items)}")
-            await interaction.followup.send(embed=embed_to_send, ephemeral=True)
-        return
-    if len(description) > 4000:
-        embed = discord.Embed(
-            title=title,
-            description="Danh sách quá dài để hiển thị hoàn toàn. Vui lòng kiểm tra cơ sở dữ liệu để xem toàn bộ danh sách.",
-            color=color
-        )
-        embed.set_footer(text=f"Tổng số {type_to_list.name.lower()}: {len(items)}")
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.warning(f"List for {type_to_list.value} was too long for single embed, truncated for {interaction.user.display_name}.")
-    else:
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
         embed = discord.Embed(
-            title=title,
-            description=description,
-            color=color
+            title="📤 Xuất dữ liệu hoàn tất!",
+            description=f"Đã xuất **{row_count}** mục ({type_to_export.name}) thành **{len(paths)}** tệp `{fmt}.gz`.",
+            color=discord.Color.green()
         )
-        embed.set_footer(text=f"Tổng số {type_to_list.name.lower()}: {len(items)}")
         await interaction.followup.send(embed=embed, ephemeral=True)
+        for path in paths:
+            await interaction.followup.send(file=discord.File(path, filename=os.path.basename(path)), ephemeral=True)
+    logger.info("Exported %s %s rows in %s file(s) for %s (ID: %s).", row_count, type_to_export.value, len(paths), interaction.user.display_name, interaction.user.id)
 
 class UGPhoneModal(ui.Modal, title='Nhập Local Storage'):
     data_input = ui.TextInput(
@@ -670,27 +3061,26 @@ class UGPhoneModal(ui.Modal, title='Nhập Local Storage'):
     )
 
     async def on_submit(self, interaction: discord.Interaction):
-        cursor = db.get_cursor()
         try:
             json.loads(self.data_input.value)
-            cursor.execute("INSERT OR IGNORE INTO ug_phones (data_json) VALUES (?)", (self.data_input.value,))
-            if cursor.rowcount > 0:
+            inserted = await db.run_write(lambda conn: insert_ug_phone(conn, self.data_input.value))
+            if inserted:
                 embed = discord.Embed(
                     title="✅ Đã lưu thành công!",
                     description='Dữ liệu Local Storage đã được lưu vào kho.',
                     color=discord.Color.green()
                 )
-                logger.info(f"Local Storage added via modal by {interaction.user.display_name} (ID: {interaction.user.id}).")
+                logger.info("Local Storage added via modal by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
             else:
                 embed = discord.Embed(
                     title="ℹ️ Dữ liệu đã tồn tại!",
                     description='Dữ liệu Local Storage này đã có trong kho. Không có gì được thêm vào.',
                     color=discord.Color.blue()
                 )
-                logger.info(f"Duplicate Local Storage attempted via modal by {interaction.user.display_name} (ID: {interaction.user.id}).")
+                logger.info("Duplicate Local Storage attempted via modal by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except json.JSONDecodeError:
-            logger.error(f"Invalid JSON in Local Storage data via modal by {interaction.user.display_name} (ID: {interaction.user.id}).")
+            logger.error("Invalid JSON in Local Storage data via modal by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
             embed = discord.Embed(
                 title="❌ Dữ liệu không hợp lệ!",
                 description="Vui lòng gửi dữ liệu Local Storage dạng JSON hợp lệ.",
@@ -698,7 +3088,7 @@ class UGPhoneModal(ui.Modal, title='Nhập Local Storage'):
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except sqlite3.Error as e:
-            logger.error(f"SQLite Error when saving UG Phone data via modal for {interaction.user.display_name}: {e}")
+            logger.error("SQLite Error when saving UG Phone data via modal for %s: %s", interaction.user.display_name, e)
             embed = discord.Embed(
                 title="❌ Lỗi lưu trữ!",
                 description=f'Đã xảy ra lỗi khi lưu dữ liệu Local Storage: {e}\n'
@@ -707,21 +3097,230 @@ class UGPhoneModal(ui.Modal, title='Nhập Local Storage'):
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
         except Exception as e:
-            logger.critical(f"Unexpected error in UGPhoneModal.on_submit for {interaction.user.display_name}: {e}")
+            logger.critical("Unexpected error in UGPhoneModal.on_submit for %s: %s", interaction.user.display_name, e)
             embed = discord.Embed(
                 title="❌ Lỗi không mong muốn!",
                 description=f'Đã xảy ra lỗi không mong muốn: {e}',
                 color=discord.Color.red()
             )
             await interaction.response.send_message(embed=embed, ephemeral=True)
-        finally:
-            db.commit()
+
+# Bulk Local Storage import. The uploaded file is parsed as a stream in a worker
+# thread: NDJSON (one entry per line, /export records included), a top-level
+# JSON array, a single JSON document, or any of those inside .gz/.zip archives.
+def iter_json_array_items(stream):
+    """Yield (text, value) for each element of a top-level JSON array read incrementally."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def more():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(IMPORT_READ_CHUNK)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof or not more():
+                return
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+    skip_whitespace()
+    if pos < len(buffer) and buffer[pos] == ']':
+        return
+    while True:
+        skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value that ends exactly at the buffer edge may be truncated (e.g. a number).
+                if end >= len(buffer) and not eof:
+                    raise json.JSONDecodeError("Incomplete value", buffer, end)
+                break
+            except json.JSONDecodeError:
+                if eof or not more():
+                    raise
+        yield buffer[pos:end], value
+        pos = end
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array.")
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] != ',':
+            raise ValueError(f"Unexpected character {buffer[pos]!r} in JSON array.")
+        pos += 1
+
+def iter_import_documents(binary_stream, name, progress):
+    """Yield (text, value) for every JSON document in one (decompressed) file."""
+    head = binary_stream.peek(IMPORT_READ_CHUNK)[:IMPORT_READ_CHUNK].lstrip(b'\xef\xbb\xbf \t\r\n')
+    stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig')
+    if head.startswith(b'['):
+        yield from iter_json_array_items(stream)
+    elif name.lower().endswith('.json') and head.startswith(b'{'):
+        yield from iter_json_object_file(stream, name, progress)
+    else:
+        yield from iter_json_lines(stream, name, progress)
+
+def iter_json_object_file(stream, name, progress):
+    """Yield the single document of a .json file, or every line if it is NDJSON saved as .json.
+
+    Only the first document is buffered. Whatever follows it streams through the line path.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    retry_at = 0
+    while True:
+        chunk = stream.read(IMPORT_READ_CHUNK)
+        buffer += chunk
+        # A large pretty-printed document is re-decoded only when the buffer has doubled
+        if chunk and len(buffer) < retry_at:
+            continue
+        start = len(buffer) - len(buffer.lstrip())
+        try:
+            value, end = decoder.raw_decode(buffer, start)
+            break
+        except json.JSONDecodeError:
+            if not chunk:
+                raise
+            retry_at = len(buffer) * 2
+    text, rest = buffer[start:end], buffer[end:]
+    del buffer
+    while not rest.strip():
+        rest = stream.read(IMPORT_READ_CHUNK)
+        if not rest:
+            yield text, value
+            return
+    # An NDJSON export saved with a .json extension: more documents follow the first
+    yield text, value
+    rest += stream.readline()
+    yield from iter_json_lines(itertools.chain(rest.splitlines(), stream), name, progress)
+
+def iter_json_lines(lines, name, progress):
+    """Yield (text, value) for every line-delimited JSON document, counting invalid lines."""
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line, json.loads(line)
+        except json.JSONDecodeError:
+            progress['invalid'] += 1
+            if progress['invalid'] <= 5:
+                logger.warning("Skipping invalid JSON on line %s of %s during import.", line_number, name)
+
+def iter_import_entries(path, filename, progress):
+    lower_name = filename.lower()
+    if lower_name.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                with archive.open(member) as member_stream:
+                    yield from iter_import_documents(io.BufferedReader(member_stream), member.filename, progress)
+    elif lower_name.endswith('.gz'):
+        with gzip.open(path, 'rb') as gz_stream:
+            yield from iter_import_documents(io.BufferedReader(gz_stream), filename[:-3], progress)
+    else:
+        with open(path, 'rb') as file_stream:
+            yield from iter_import_documents(file_stream, filename, progress)
+
+def import_ug_phone_file(path: str, filename: str, progress: dict):
+    """Validate, canonicalize and insert every entry of an uploaded file in executemany batches.
+    Runs in a worker thread; each batch is one write transaction."""
+    batch = []
+
+    def flush():
+        rows = list(batch)
+        batch.clear()
+        added = db.submit_write(lambda conn: conn.executemany("INSERT OR IGNORE INTO ug_phones (data_json, content_hash) VALUES (?, ?)", rows).rowcount).result()
+        progress['added'] += added
+        progress['skipped'] += len(rows) - added
+
+    try:
+        for text, value in iter_import_entries(path, filename, progress):
+            progress['read'] += 1
+            # Records produced by /export wrap the original entry as {"id": ..., "data_json": "..."}
+            if isinstance(value, dict) and value.keys() == {'id', 'data_json'} and isinstance(value['data_json'], str):
+                text = value['data_json']
+                try:
+                    value = json.loads(text)
+                except json.JSONDecodeError:
+                    progress['invalid'] += 1
+                    continue
+            batch.append((text, canonical_json_hash(value)))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+    finally:
+        # Keep the entries parsed before a malformed section stopped the stream.
+        if batch:
+            flush()
+
+async def download_attachment(attachment: discord.Attachment, path: str):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(attachment.url) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as file:
+                async for chunk in response.content.iter_chunked(IMPORT_READ_CHUNK):
+                    file.write(chunk)
+
+def build_import_embed(filename: str, progress: dict, done: bool = False, error: str = None):
+    description = (f"Tệp: `{filename}`\n"
+                   f"Đã đọc: **{progress['read']}**\n"
+                   f"Đã thêm: **{progress['added']}**\n"
+                   f"Bỏ qua (đã tồn tại): **{progress['skipped']}**\n"
+                   f"Không hợp lệ: **{progress['invalid']}**")
+    if error:
+        return discord.Embed(title="❌ Nhập dữ liệu bị dừng!", description=f"{description}\n\nLỗi: `{error}`", color=discord.Color.red())
+    if done:
+        return discord.Embed(title="✅ Nhập Local Storage hoàn tất!", description=description, color=discord.Color.green())
+    return discord.Embed(title="⏳ Đang nhập Local Storage...", description=description, color=discord.Color.blue())
+
+@bot.tree.command(name='importugphone', description='Bulk import Local Storage from an NDJSON, JSON array, .gz or .zip attachment.')
+@app_commands.check(is_owner)
+@app_commands.check(is_allowed_admin_channel)
+@app_commands.describe(file='NDJSON / JSON array file (optionally .gz or .zip) with one Local Storage entry per item.')
+async def import_ug_phone(interaction: discord.Interaction, file: discord.Attachment):
+    await interaction.response.defer(ephemeral=True)
+    logger.info("User %s (ID: %s) used /importugphone with %s (%s bytes).", interaction.user.display_name, interaction.user.id, file.filename, file.size)
+    progress = {'read': 0, 'added': 0, 'skipped': 0, 'invalid': 0}
+    message = await interaction.followup.send(embed=build_import_embed(file.filename, progress), ephemeral=True, wait=True)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='import_') as directory:
+        path = os.path.join(directory, 'upload')
+        error = None
+        try:
+            await download_attachment(file, path)
+            worker = asyncio.ensure_future(asyncio.to_thread(import_ug_phone_file, path, file.filename, progress))
+            while not worker.done():
+                await asyncio.wait({worker}, timeout=IMPORT_PROGRESS_INTERVAL)
+                if not worker.done():
+                    await message.edit(embed=build_import_embed(file.filename, progress))
+            worker.result()
+        except (ValueError, json.JSONDecodeError, zipfile.BadZipFile, OSError, UnicodeDecodeError, aiohttp.ClientError, sqlite3.Error) as e:
+            error = str(e)
+            logger.error("Error importing Local Storage from %s for %s: %s", file.filename, interaction.user.display_name, e)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.exception("Unexpected error importing Local Storage from %s for %s", file.filename, interaction.user.display_name)
+    await message.edit(embed=build_import_embed(file.filename, progress, done=True, error=error))
+    logger.info("Import of %s finished in %.1fs: %s.", file.filename, time.perf_counter() - started, progress)
 
 @bot.tree.command(name='addugphone', description='Add Local Storage info for users to receive.')
 @app_commands.check(is_owner)
 @app_commands.check(is_allowed_admin_channel)
 async def add_ug_phone(interaction: discord.Interaction):
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /addugphone (modal).")
+    logger.info("User %s (ID: %s) used /addugphone (modal).", interaction.user.display_name, interaction.user.id)
     await interaction.response.send_modal(UGPhoneModal())
 
 @bot.tree.command(name='quickaddug', description='Start a session to add multiple Local Storage entries.')
@@ -729,16 +3328,15 @@ async def add_ug_phone(interaction: discord.Interaction):
 @app_commands.check(is_allowed_admin_channel)
 async def quick_add_ug_command(interaction: discord.Interaction):
     user_id = interaction.user.id
-    if user_id in bot.quick_add_ug_sessions:
+    if not await quick_add_staging.open(user_id, interaction.channel_id):
         embed = discord.Embed(
             title="⚠️ Phiên đã hoạt động!",
             description="Bạn đã có một phiên nhập Local Storage đang hoạt động. Vui lòng gửi `done` để kết thúc hoặc `cancel` để hủy bỏ phiên hiện tại.",
             color=discord.Color.orange()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.warning(f"User {interaction.user.display_name} (ID: {user_id}) tried to start /quickaddug session but already has one.")
+        logger.warning("User %s (ID: %s) tried to start /quickaddug session but already has one.", interaction.user.display_name, user_id)
         return
-    bot.quick_add_ug_sessions[user_id] = []
     embed = discord.Embed(
         title="✨ Đã bắt đầu phiên thêm nhanh Local Storage! ✨",
         description="Vui lòng bắt đầu dán các chuỗi Local Storage (mỗi chuỗi là một tin nhắn riêng biệt).\n"
@@ -747,92 +3345,98 @@ async def quick_add_ug_command(interaction: discord.Interaction):
         color=discord.Color.blue()
     )
     await interaction.response.send_message(embed=embed, ephemeral=False)
-    logger.info(f"User {interaction.user.display_name} (ID: {user_id}) started a /quickaddug session.")
+    logger.info("User %s (ID: %s) started a /quickaddug session.", interaction.user.display_name, user_id)
 
 @bot.tree.command(name='getugphone', description='Use 150 coins to receive Local Storage.')
 async def get_ug_phone_command(interaction: discord.Interaction):
     user_id = interaction.user.id
     cost = 150
     is_owner_user = user_id in OWNER_IDS
-    if not is_owner_user:
-        current_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user_id)
-        if current_balance < cost:
-            embed = discord.Embed(
-                title="💰 Không đủ tiền!",
-                description=f'Bạn không có đủ **{cost} coin** để nhận Local Storage. Số dư hiện tại của bạn là **{current_balance} coin**.',
-                color=discord.Color.orange()
-            )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            logger.warning(f"User {interaction.user.display_name} (ID: {user_id}) tried to /getugphone but had insufficient balance ({current_balance} < {cost}).")
-            return
     await interaction.response.defer(ephemeral=True)
-    cursor = db.get_cursor()
-    cursor.execute("SELECT id, data_json FROM ug_phones ORDER BY RANDOM() LIMIT 1")
-    result = cursor.fetchone()
-    if not result:
+    retry_after = await admission.acquire('getugphone', user_id)
+    if retry_after is not None:
+        await send_busy_message(interaction, retry_after)
+        return
+    status, result = await ug_phone_leases.claim(user_id, 0 if is_owner_user else cost)
+    if status == 'insufficient':
+        embed = discord.Embed(
+            title="💰 Không đủ tiền!",
+            description=f'Bạn không có đủ **{cost} coin** để nhận Local Storage. Số dư hiện tại của bạn là **{result} coin**.',
+            color=discord.Color.orange()
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        logger.warning("User %s (ID: %s) tried to /getugphone but had insufficient balance (%s < %s).", interaction.user.display_name, user_id, result, cost)
+        return
+    if status == 'empty':
         embed = discord.Embed(
             title="⚠️ Kho trống!",
             description='Hiện tại không có Local Storage nào trong kho. Vui lòng thử lại sau hoặc liên hệ quản trị viên.',
             color=discord.Color.orange()
         )
         await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.warning(f"User {interaction.user.display_name} (ID: {user_id}) tried to /getugphone, but ug_phones table is empty.")
+        logger.warning("User %s (ID: %s) tried to /getugphone, but ug_phones table is empty.", interaction.user.display_name, user_id)
         return
     item_id, local_storage_data = result
     if not is_owner_user:
-        await bot.loop.run_in_executor(None, update_user_hcoin, user_id, -cost)
-        logger.info(f"User {interaction.user.display_name} (ID: {user_id}) used {cost} coins for Local Storage.")
+        logger.info("User %s (ID: %s) used %s coins for Local Storage.", interaction.user.display_name, user_id, cost)
+    charged = 0 if is_owner_user else cost
+    dm_content = f"```\n{local_storage_data}\n```"
+    chunk_size = 1990
+    if len(dm_content) > chunk_size:
+        chunks = [dm_content[i:i + chunk_size] for i in range(0, len(dm_content), chunk_size)]
+        parts = [f"Phần {i+1}/{len(chunks)}:\n{chunk}" for i, chunk in enumerate(chunks)]
+    else:
+        parts = [dm_content]
+    # Only a DM that never delivered any content may release the lease; once a
+    # part has been sent the item counts as dispensed.
+    sent_parts = 0
     try:
         user_dm = await interaction.user.create_dm()
-        dm_content = f"```\n{local_storage_data}\n```"
-        chunk_size = 1990
-        if len(dm_content) > chunk_size:
-            chunks = [dm_content[i:i + chunk_size] for i in range(0, len(dm_content), chunk_size)]
-            for i, chunk in enumerate(chunks):
-                await user_dm.send(f"Phần {i+1}/{len(chunks)}:\n{chunk}")
-            embed = discord.Embed(
-                title="📦 Local Storage đã gửi!",
-                description=f'Local Storage đã được gửi đến tin nhắn riêng của bạn (gồm {len(chunks)} phần). Vui lòng kiểm tra DM của bạn!',
-                color=discord.Color.green()
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
-            logger.info(f"Sent Local Storage (in {len(chunks)} parts) to DM of {user_id}.")
+        for part in parts:
+            await user_dm.send(part)
+            sent_parts += 1
+    except Exception as e:
+        if sent_parts == 0:
+            await ug_phone_leases.release(user_id, item_id)
+            if isinstance(e, discord.Forbidden):
+                embed = discord.Embed(
+                    title="🚫 Không thể gửi DM!",
+                    description='Tôi không thể gửi tin nhắn trực tiếp cho bạn. Vui lòng bật **Cho phép tin nhắn trực tiếp từ thành viên máy chủ** trong cài đặt quyền riêng tư. Coin đã được hoàn lại.',
+                    color=discord.Color.red()
+                )
+                logger.error("Failed to send DM to %s for /getugphone (Forbidden). Local Storage ID %s was returned to stock.", user_id, item_id)
+            else:
+                embed = discord.Embed(
+                    title="❌ Lỗi gửi DM!",
+                    description=f'Đã xảy ra lỗi khi gửi DM: {e}. Local Storage không bị trừ và vẫn còn trong kho.',
+                    color=discord.Color.red()
+                )
+                logger.critical("Unexpected error sending DM to %s for /getugphone: %s. Local Storage ID %s was returned to stock.", user_id, e, item_id)
         else:
-            await user_dm.send(dm_content)
+            await ug_phone_leases.commit(user_id, item_id, charged)
             embed = discord.Embed(
-                title="📦 Local Storage đã gửi!",
-                description=f'Local Storage đã được gửi đến tin nhắn riêng của bạn. Vui lòng kiểm tra DM của bạn!',
-                color=discord.Color.green()
+                title="⚠️ Gửi DM bị gián đoạn!",
+                description=f'Chỉ gửi được {sent_parts}/{len(parts)} phần Local Storage vào DM của bạn ({e}). Vui lòng liên hệ quản trị viên để nhận phần còn lại.',
+                color=discord.Color.orange()
             )
+            logger.critical("DM of Local Storage ID %s to %s failed after %s/%s parts: %s. The item was marked as delivered.", item_id, user_id, sent_parts, len(parts), e)
+        try:
             await interaction.followup.send(embed=embed, ephemeral=True)
-            logger.info(f"Sent Local Storage to DM of {user_id}.")
-        cursor.execute("DELETE FROM ug_phones WHERE id = ?", (item_id,))
-        db.commit()
-        logger.info(f"Local Storage item with ID {item_id} successfully deleted from DB after being sent to user {user_id}.")
-    except discord.Forbidden:
-        embed = discord.Embed(
-            title="🚫 Không thể gửi DM!",
-            description='Tôi không thể gửi tin nhắn trực tiếp cho bạn. Vui lòng bật **Cho phép tin nhắn trực tiếp từ thành viên máy chủ** trong cài đặt quyền riêng tư. Coin đã được hoàn lại.',
-            color=discord.Color.red()
-        )
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.error(f"Failed to send DM to {user_id} for /getugphone (Forbidden). Local Storage ID {item_id} was NOT deleted.")
-        if not is_owner_user:
-            await bot.loop.run_in_executor(None, update_user_hcoin, user_id, cost)
-            logger.info(f"Refunded {cost} coins to user {user_id} due to DM failure for Local Storage ID {item_id}.")
-    except Exception as e:
-        embed = discord.Embed(
-            title="❌ Lỗi gửi DM!",
-            description=f'Đã xảy ra lỗi khi gửi DM: {e}. Local Storage không bị trừ và vẫn còn trong kho.',
-            color=discord.Color.red()
-        )
+        except discord.HTTPException as followup_error:
+            logger.warning("Could not send the /getugphone followup to %s: %s", user_id, followup_error)
+        return
+
+    await ug_phone_leases.commit(user_id, item_id, charged)
+    logger.info("Sent Local Storage ID %s (in %s parts) to DM of %s; lease committed.", item_id, len(parts), user_id)
+    if len(parts) > 1:
+        description = f'Local Storage đã được gửi đến tin nhắn riêng của bạn (gồm {len(parts)} phần). Vui lòng kiểm tra DM của bạn!'
+    else:
+        description = 'Local Storage đã được gửi đến tin nhắn riêng của bạn. Vui lòng kiểm tra DM của bạn!'
+    embed = discord.Embed(title="📦 Local Storage đã gửi!", description=description, color=discord.Color.green())
+    try:
         await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.critical(f"Unexpected error sending DM to {user_id} for /getugphone: {e}. Local Storage ID {item_id} was NOT deleted.")
-        if not is_owner_user:
-            await bot.loop.run_in_executor(None, update_user_hcoin, user_id, cost)
-            logger.info(f"Refunded {cost} coins to user {user_id} due to DM failure for Local Storage ID {item_id}.")
-    finally:
-        db.commit()
+    except discord.HTTPException as e:
+        logger.warning("Could not send the /getugphone followup to %s after delivering the DM: %s", user_id, e)
 
 @bot.tree.command(name='delete_ug_data', description='Delete a Local Storage entry by its full content.')
 @app_commands.check(is_owner)
@@ -840,29 +3444,27 @@ async def get_ug_phone_command(interaction: discord.Interaction):
 @app_commands.describe(data_to_delete='The exact Local Storage string to delete.')
 async def delete_ug_data(interaction: discord.Interaction, data_to_delete: str):
     await interaction.response.defer(ephemeral=True)
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /delete_ug_data.")
-    cursor = db.get_cursor()
+    logger.info("User %s (ID: %s) used /delete_ug_data.", interaction.user.display_name, interaction.user.id)
     try:
         json.loads(data_to_delete)
-        cursor.execute("DELETE FROM ug_phones WHERE data_json = ?", (data_to_delete,))
-        db.commit()
-        if cursor.rowcount > 0:
+        deleted = await db.execute("DELETE FROM ug_phones WHERE content_hash = ?", (ug_phone_content_hash(data_to_delete),))
+        if deleted > 0:
             embed = discord.Embed(
                 title="✅ Xóa Local Storage Thành Công!",
                 description="Dữ liệu Local Storage đã được xóa khỏi kho.",
                 color=discord.Color.green()
             )
-            logger.info(f"Local Storage deleted by {interaction.user.display_name} (ID: {interaction.user.id}).")
+            logger.info("Local Storage deleted by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
         else:
             embed = discord.Embed(
                 title="❌ Không tìm thấy dữ liệu!",
                 description="Không tìm thấy dữ liệu Local Storage khớp với nội dung bạn cung cấp.",
                 color=discord.Color.red()
             )
-            logger.warning(f"Local Storage not found for deletion by {interaction.user.display_name} (ID: {interaction.user.id}).")
+            logger.warning("Local Storage not found for deletion by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
         await interaction.followup.send(embed=embed, ephemeral=True)
     except json.JSONDecodeError:
-        logger.error(f"Invalid JSON in Local Storage data for deletion by {interaction.user.display_name} (ID: {interaction.user.id}).")
+        logger.error("Invalid JSON in Local Storage data for deletion by %s (ID: %s).", interaction.user.display_name, interaction.user.id)
         embed = discord.Embed(
             title="❌ Dữ liệu không hợp lệ!",
             description="Dữ liệu Local Storage phải là JSON hợp lệ.",
@@ -870,7 +3472,7 @@ async def delete_ug_data(interaction: discord.Interaction, data_to_delete: str):
         )
         await interaction.followup.send(embed=embed, ephemeral=True)
     except sqlite3.Error as e:
-        logger.error(f"SQLite Error deleting UG Phone data via /delete_ug_data for {interaction.user.display_name}: {e}")
+        logger.error("SQLite Error deleting UG Phone data via /delete_ug_data for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi xóa!",
             description=f'Đã xảy ra lỗi khi xóa dữ liệu Local Storage: {e}\n'
@@ -879,7 +3481,7 @@ async def delete_ug_data(interaction: discord.Interaction, data_to_delete: str):
         )
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        logger.critical(f"Unexpected error in /delete_ug_data for {interaction.user.display_name}: {e}")
+        logger.critical("Unexpected error in /delete_ug_data for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi không mong muốn!",
             description=f'Đã xảy ra lỗi không mong muốn: {e}',
@@ -893,28 +3495,26 @@ async def delete_ug_data(interaction: discord.Interaction, data_to_delete: str):
 @app_commands.describe(item_id='The unique ID of the Local Storage entry to delete.')
 async def delete_ug_by_id(interaction: discord.Interaction, item_id: int):
     await interaction.response.defer(ephemeral=True)
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) used /delete_ug_by_id with ID: {item_id}")
-    cursor = db.get_cursor()
+    logger.info("User %s (ID: %s) used /delete_ug_by_id with ID: %s", interaction.user.display_name, interaction.user.id, item_id)
     try:
-        cursor.execute("DELETE FROM ug_phones WHERE id = ?", (item_id,))
-        db.commit()
-        if cursor.rowcount > 0:
+        deleted = await db.execute("DELETE FROM ug_phones WHERE id = ?", (item_id,))
+        if deleted > 0:
             embed = discord.Embed(
                 title="✅ Xóa Local Storage Thành Công!",
                 description=f"Dữ liệu Local Storage với ID `{item_id}` đã được xóa khỏi kho.",
                 color=discord.Color.green()
             )
-            logger.info(f"Local Storage with ID {item_id} deleted by {interaction.user.display_name} (ID: {interaction.user.id}).")
+            logger.info("Local Storage with ID %s deleted by %s (ID: %s).", item_id, interaction.user.display_name, interaction.user.id)
         else:
             embed = discord.Embed(
                 title="❌ Không tìm thấy ID!",
                 description=f"Không tìm thấy dữ liệu Local Storage với ID `{item_id}`.",
                 color=discord.Color.red()
             )
-            logger.warning(f"Local Storage with ID {item_id} not found for deletion by {interaction.user.display_name} (ID: {interaction.user.id}).")
+            logger.warning("Local Storage with ID %s not found for deletion by %s (ID: %s).", item_id, interaction.user.display_name, interaction.user.id)
         await interaction.followup.send(embed=embed, ephemeral=True)
     except sqlite3.Error as e:
-        logger.error(f"SQLite Error deleting UG Phone data via /delete_ug_by_id for {interaction.user.display_name}: {e}")
+        logger.error("SQLite Error deleting UG Phone data via /delete_ug_by_id for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi xóa!",
             description=f'Đã xảy ra lỗi khi xóa dữ liệu Local Storage: {e}\n'
@@ -923,7 +3523,7 @@ async def delete_ug_by_id(interaction: discord.Interaction, item_id: int):
         )
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        logger.critical(f"Unexpected error in /delete_ug_by_id for {interaction.user.display_name}: {e}")
+        logger.critical("Unexpected error in /delete_ug_by_id for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi không mong muốn!",
             description=f'Đã xảy ra lỗi không mong muốn: {e}',
@@ -934,15 +3534,68 @@ async def delete_ug_by_id(interaction: discord.Interaction, item_id: int):
 @bot.tree.command(name='balance', description='Check your Hcoin balance.')
 async def balance(interaction: discord.Interaction):
     user_id = interaction.user.id
-    current_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user_id)
+    current_balance, rank, total = await get_user_rank(user_id)
     embed = discord.Embed(
         title="💰 Số dư Hcoin của bạn",
         description=f'Bạn hiện có **{current_balance} coin**.',
         color=discord.Color.gold()
     )
+    embed.add_field(name="Xếp hạng", value=f"**#{rank}** / {total}" if rank else "Chưa xếp hạng", inline=True)
     embed.set_footer(text="Sử dụng coin để nhận Local Storage!")
     await interaction.response.send_message(embed=embed, ephemeral=True)
-    logger.info(f"User {interaction.user.display_name} (ID: {user_id}) checked balance: {current_balance} coins.")
+    logger.info("User %s (ID: %s) checked balance: %s coins.", interaction.user.display_name, user_id, current_balance)
+
+@bot.tree.command(name='querystats', description='Show per-statement SQL timing statistics.')
+@app_commands.check(is_owner)
+@app_commands.check(is_allowed_admin_channel)
+@app_commands.describe(limit='Number of statements to show, by total time (default 10).', reset='Clear the statistics after showing them.')
+async def query_stats_command(interaction: discord.Interaction, limit: app_commands.Range[int, 1, 25] = 10, reset: bool = False):
+    stats = query_stats.snapshot()
+    if reset:
+        query_stats.reset()
+    if not stats:
+        await interaction.response.send_message("Chưa có thống kê truy vấn nào.", ephemeral=True)
+        return
+    embed = discord.Embed(
+        title="🐢 Thống kê truy vấn SQL",
+        description=f"Sắp xếp theo tổng thời gian. Ngưỡng truy vấn chậm: **{SLOW_QUERY_MS:g} ms**.",
+        color=discord.Color.blue()
+    )
+    for sql, count, total_ms, p50_ms, p99_ms, max_ms, rows, slow, plan in stats[:limit]:
+        value = (f"`{count}` lần • tổng `{total_ms:.1f} ms` • p50 `{p50_ms:.2f} ms` • p99 `{p99_ms:.2f} ms` • max `{max_ms:.1f} ms`\n"
+                 f"`{rows}` dòng • `{slow}` lần chậm")
+        if plan:
+            value += f"\nPlan: `{plan[:300]}`"
+        embed.add_field(name=sql[:250], value=value[:1024], inline=False)
+        if len(embed) > 5500:
+            break
+    if reset:
+        embed.set_footer(text="Thống kê đã được đặt lại.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    logger.info("Owner %s (ID: %s) viewed SQL statistics (reset=%s).", interaction.user.display_name, interaction.user.id, reset)
+
+@bot.tree.command(name='loopstalls', description='Show recent event-loop stalls and what caused them.')
+@app_commands.check(is_owner)
+@app_commands.check(is_allowed_admin_channel)
+@app_commands.describe(limit='Number of stalls to show, newest first (default 3).')
+async def loop_stalls_command(interaction: discord.Interaction, limit: app_commands.Range[int, 1, 5] = 3):
+    stalls = list(loop_watchdog.stalls)[-limit:][::-1]
+    embed = discord.Embed(
+        title="⏱️ Event loop bị chặn",
+        description=f"Ngưỡng: **{LOOP_STALL_THRESHOLD_MS:g} ms** • Độ trễ lớn nhất từ khi khởi động: **{loop_watchdog.max_lag * 1000:.0f} ms**",
+        color=discord.Color.blue()
+    )
+    if not stalls:
+        embed.description += "\n\nChưa ghi nhận lần bị chặn nào."
+    for stall in stalls:
+        stack_tail = "\n".join(stall['stack'].strip().splitlines()[-8:]) or "(không có stack)"
+        embed.add_field(
+            name=f"{stall['lag_ms']:.0f} ms • {stall['handler']}"[:256],
+            value=f"<t:{int(stall['at'])}:R>\n```py\n{stack_tail[-950:]}\n```",
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    logger.info("Owner %s (ID: %s) viewed event loop stalls.", interaction.user.display_name, interaction.user.id)
 
 @bot.tree.command(name='add_hcoin', description='Add Hcoin to a user.')
 @app_commands.check(is_owner)
@@ -952,8 +3605,7 @@ async def add_hcoin(interaction: discord.Interaction, user: discord.Member, amou
     if amount <= 0:
         await interaction.response.send_message("Số lượng Hcoin thêm phải lớn hơn 0.", ephemeral=True)
         return
-    await bot.loop.run_in_executor(None, update_user_hcoin, user.id, amount)
-    new_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user.id)
+    new_balance = await update_user_hcoin(user.id, amount, 'admin_add', interaction.user.id)
     embed = discord.Embed(
         title="✅ Đã thêm Hcoin!",
         description=f'Đã thêm **{amount} coin** cho {user.mention}.',
@@ -961,7 +3613,7 @@ async def add_hcoin(interaction: discord.Interaction, user: discord.Member, amou
     )
     embed.add_field(name="Số dư mới", value=f"**{new_balance} coin**", inline=True)
     await interaction.response.send_message(embed=embed)
-    logger.info(f"Owner {interaction.user.display_name} (ID: {interaction.user.id}) added {amount} coins to {user.display_name} (ID: {user.id}). New balance: {new_balance}.")
+    logger.info("Owner %s (ID: %s) added %s coins to %s (ID: %s). New balance: %s.", interaction.user.display_name, interaction.user.id, amount, user.display_name, user.id, new_balance)
 
 @bot.tree.command(name='remove_hcoin', description='Remove Hcoin from a user.')
 @app_commands.check(is_owner)
@@ -971,18 +3623,16 @@ async def remove_hcoin(interaction: discord.Interaction, user: discord.Member, a
     if amount <= 0:
         await interaction.response.send_message("Số lượng Hcoin cần xóa phải lớn hơn 0.", ephemeral=True)
         return
-    current_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user.id)
-    if current_balance < amount:
+    debited, new_balance = await db.run_write(lambda conn: debit_user_hcoin(conn, user.id, amount, 'admin_remove', interaction.user.id))
+    if not debited:
         embed = discord.Embed(
             title="⚠️ Không đủ Hcoin để xóa!",
-            description=f'{user.mention} chỉ có **{current_balance} coin**. Không thể xóa **{amount} coin**.',
+            description=f'{user.mention} chỉ có **{new_balance} coin**. Không thể xóa **{amount} coin**.',
             color=discord.Color.orange()
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.warning(f"Owner {interaction.user.display_name} (ID: {interaction.user.id}) tried to remove {amount} coins from {user.display_name} (ID: {user.id}), but user only has {current_balance}.")
+        logger.warning("Owner %s (ID: %s) tried to remove %s coins from %s (ID: %s), but user only has %s.", interaction.user.display_name, interaction.user.id, amount, user.display_name, user.id, new_balance)
         return
-    await bot.loop.run_in_executor(None, update_user_hcoin, user.id, -amount)
-    new_balance = await bot.loop.run_in_executor(None, get_user_hcoin, user.id)
     embed = discord.Embed(
         title="✅ Đã xóa Hcoin!",
         description=f'Đã xóa **{amount} coin** từ {user.mention}.',
@@ -990,40 +3640,117 @@ async def remove_hcoin(interaction: discord.Interaction, user: discord.Member, a
     )
     embed.add_field(name="Số dư mới", value=f"**{new_balance} coin**", inline=True)
     await interaction.response.send_message(embed=embed)
-    logger.info(f"Owner {interaction.user.display_name} (ID: {interaction.user.id}) removed {amount} coins from {user.display_name} (ID: {user.id}). New balance: {new_balance}.")
+    logger.info("Owner %s (ID: %s) removed %s coins from %s (ID: %s). New balance: %s.", interaction.user.display_name, interaction.user.id, amount, user.display_name, user.id, new_balance)
+
+# Function to build one /hcoin_top page embed. Returns (embed, total_pages).
+async def build_hcoin_top_embed(page: int):
+    rows, total = await fetch_hcoin_top_page(page)
+    total_pages = max(1, -(-total // HCOIN_TOP_PAGE_SIZE))
+    if not rows:
+        description = "Chưa có ai trong bảng xếp hạng Hcoin." if not total else f"Trang {page} không tồn tại. Bảng xếp hạng có {total_pages} trang."
+        return discord.Embed(title="🏆 Bảng xếp hạng Hcoin", description=description, color=discord.Color.gold()), total_pages
+    first_position = (page - 1) * HCOIN_TOP_PAGE_SIZE + 1
+    if page == 1:
+        description = f"**Top {HCOIN_TOP_PAGE_SIZE} người dùng có nhiều Hcoin nhất:**\n\n"
+    else:
+        description = f"**Hạng {first_position} - {first_position + len(rows) - 1}:**\n\n"
+    names = await user_names.resolve_many([user_id for user_id, _ in rows])
+    for i, (user_id, balance) in enumerate(rows):
+        description += f"**{first_position + i}.** {names[user_id]}: **{balance} coin**\n"
+    embed = discord.Embed(
+        title="🏆 Bảng xếp hạng Hcoin",
+        description=description,
+        color=discord.Color.gold()
+    )
+    embed.set_footer(text=f"Trang {page}/{total_pages} • Ai sẽ là người đứng đầu?")
+    return embed, total_pages
+
+class HcoinTopView(ui.View):
+    def __init__(self, owner_id: int, page: int, total_pages: int):
+        super().__init__(timeout=LIST_VIEW_TIMEOUT)
+        self.owner_id = owner_id
+        self.message = None
+        self.update_buttons(page, total_pages)
+
+    def update_buttons(self, page: int, total_pages: int):
+        self.page = page
+        self.total_pages = total_pages
+        self.prev_button.disabled = page <= 1
+        self.next_button.disabled = page >= total_pages
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner_id
+
+    async def show(self, interaction: discord.Interaction, page: int):
+        await interaction.response.defer()
+        embed, total_pages = await build_hcoin_top_embed(page)
+        self.update_buttons(page, total_pages)
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    @ui.button(emoji='◀️', style=discord.ButtonStyle.primary)
+    async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, self.page - 1)
+
+    @ui.button(emoji='▶️', style=discord.ButtonStyle.primary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.show(interaction, self.page + 1)
 
 @bot.tree.command(name='hcoin_top', description='Show top Hcoin balances.')
-async def hcoin_top(interaction: discord.Interaction):
+@app_commands.describe(page='Leaderboard page to show (default 1).')
+async def hcoin_top(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1):
     await interaction.response.defer()
-    cursor = db.get_cursor()
-    cursor.execute("SELECT user_id, hcoin_balance FROM user_balances ORDER BY hcoin_balance DESC LIMIT 10")
-    top_users = cursor.fetchall()
-    if not top_users:
-        embed = discord.Embed(
-            title="🏆 Bảng xếp hạng Hcoin",
-            description="Chưa có ai trong bảng xếp hạng Hcoin.",
-            color=discord.Color.gold()
-        )
+    embed, total_pages = await build_hcoin_top_embed(page)
+    if total_pages > 1:
+        view = HcoinTopView(interaction.user.id, page, total_pages)
+        view.message = await interaction.followup.send(embed=embed, view=view, wait=True)
+    else:
         await interaction.followup.send(embed=embed)
+    logger.info("User %s (ID: %s) viewed Hcoin top list.", interaction.user.display_name, interaction.user.id)
+
+HCOIN_LEDGER_REASONS = {
+    'redeem': "Đổi mã",
+    'admin_add': "Quản trị viên thêm",
+    'admin_remove': "Quản trị viên trừ",
+    'ugphone_purchase': "Mua Local Storage",
+    'ugphone_refund': "Hoàn tiền Local Storage",
+    'ugphone_late_delivery': "Thu lại phí Local Storage giao trễ",
+    'snapshot': "Số dư gộp",
+    'adjust': "Điều chỉnh",
+}
+
+@bot.tree.command(name='hcoin_history', description='Show recent Hcoin transactions.')
+@app_commands.describe(user='(Owner only) The user whose history to show.')
+async def hcoin_history(interaction: discord.Interaction, user: discord.User = None):
+    target = user or interaction.user
+    if target.id != interaction.user.id and interaction.user.id not in OWNER_IDS:
+        await interaction.response.send_message("Bạn chỉ có thể xem lịch sử Hcoin của chính mình.", ephemeral=True)
         return
-    description = "**Top 10 người dùng có nhiều Hcoin nhất:**\n\n"
-    for i, (user_id, balance) in enumerate(top_users):
-        try:
-            user = await bot.fetch_user(user_id)
-            user_name = user.display_name
-        except discord.NotFound:
-            user_name = f"Người dùng không tồn tại (ID: {user_id})"
-        except Exception:
-            user_name = f"Không thể lấy tên (ID: {user_id})"
-        description += f"**{i+1}.** {user_name}: **{balance} coin**\n"
+    rows = await get_hcoin_history(target.id)
+    if not rows:
+        description = "Chưa có giao dịch Hcoin nào."
+    else:
+        lines = []
+        for entry_id, delta, reason, ref, ts in rows:
+            label = HCOIN_LEDGER_REASONS.get(reason, reason)
+            lines.append(f"<t:{int(ts)}:R> **{delta:+d} coin** • {label}")
+        description = "\n".join(lines)
     embed = discord.Embed(
-        title="🏆 Bảng xếp hạng Hcoin",
+        title=f"📒 Lịch sử Hcoin của {target.display_name}",
         description=description,
         color=discord.Color.gold()
     )
-    embed.set_footer(text="Ai sẽ là người đứng đầu?")
-    await interaction.followup.send(embed=embed)
-    logger.info(f"User {interaction.user.display_name} (ID: {interaction.user.id}) viewed Hcoin top list.")
+    embed.set_footer(text=f"{HCOIN_HISTORY_PAGE_SIZE} giao dịch gần nhất")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    logger.info("User %s (ID: %s) viewed Hcoin history of user %s.", interaction.user.display_name, interaction.user.id, target.id)
 
 @bot.tree.command(name='info', description='Get information about the bot.')
 async def info(interaction: discord.Interaction):
@@ -1038,15 +3765,20 @@ async def info(interaction: discord.Interaction):
     - `/getugphone`: Sử dụng coin để nhận Local Storage.
     - `/balance`: Kiểm tra số dư coin của bạn.
     - `/hcoin_top`: Xem bảng xếp hạng Hcoin.
+    - `/hcoin_history`: Xem lịch sử giao dịch Hcoin của bạn.
     """, inline=False)
     embed.add_field(name="Các lệnh dành cho chủ sở hữu bot", value="""
     - `/addugphone`: Thêm Local Storage thủ công.
     - `/quickaddug`: Thêm nhiều Local Storage trong một phiên.
+    - `/importugphone`: Nhập hàng loạt Local Storage từ tệp đính kèm.
     - `/delete_ug_data`: Xóa Local Storage cụ thể (bằng nội dung).
     - `/delete_ug_by_id`: Xóa Local Storage cụ thể (bằng ID).
     - `/remove`: Xóa mã đổi thưởng.
     - `/list`: Liệt kê mã, link Pastebin hoặc Local Storage.
+    - `/export`: Xuất mã, link Pastebin hoặc Local Storage thành tệp nén.
     - `/add_hcoin`: Thêm coin cho người dùng.
+    - `/querystats`: Xem thống kê thời gian truy vấn SQL.
+    - `/loopstalls`: Xem các lần event loop bị chặn gần đây.
     - `/remove_hcoin`: Xóa coin khỏi người dùng.
     - `/sync_commands`: Đồng bộ lệnh slash.
     - `/deduplicate_ugphone`: Chạy deduplication thủ công.
@@ -1060,9 +3792,9 @@ async def info(interaction: discord.Interaction):
 @app_commands.check(is_allowed_admin_channel)
 async def deduplicate_ug_phone_command(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    logger.info(f"Owner {interaction.user.display_name} (ID: {interaction.user.id}) used /deduplicate_ugphone.")
+    logger.info("Owner %s (ID: %s) used /deduplicate_ugphone.", interaction.user.display_name, interaction.user.id)
     try:
-        initial_count, final_count = await bot.loop.run_in_executor(None, deduplicate_ug_phones_data)
+        initial_count, final_count = await db.run_write(deduplicate_ug_phones_data)
         removed_count = initial_count - final_count
         if removed_count > 0:
             embed = discord.Embed(
@@ -1072,7 +3804,7 @@ async def deduplicate_ug_phone_command(interaction: discord.Interaction):
                             f"Tổng số mục sau khi deduplicate: **{final_count}**",
                 color=discord.Color.green()
             )
-            logger.info(f"Deduplication successful for ug_phones. Removed {removed_count} duplicates.")
+            logger.info("Deduplication successful for ug_phones. Removed %s duplicates.", removed_count)
         else:
             embed = discord.Embed(
                 title="ℹ️ Không có trùng lặp!",
@@ -1082,7 +3814,7 @@ async def deduplicate_ug_phone_command(interaction: discord.Interaction):
             logger.info("No duplicates found in ug_phones table.")
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        logger.critical(f"Error during deduplication via /deduplicate_ugphone for {interaction.user.display_name}: {e}")
+        logger.critical("Error during deduplication via /deduplicate_ugphone for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi khi deduplicate!",
             description=f'Đã xảy ra lỗi khi xử lý trùng lặp: {e}',
@@ -1095,7 +3827,7 @@ async def deduplicate_ug_phone_command(interaction: discord.Interaction):
 @app_commands.check(is_allowed_admin_channel)
 async def sync_commands(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    logger.info(f"Owner {interaction.user.display_name} (ID: {interaction.user.id}) used /sync_commands.")
+    logger.info("Owner %s (ID: %s) used /sync_commands.", interaction.user.display_name, interaction.user.id)
     try:
         if TEST_GUILD_ID:
             test_guild_id_int = int(TEST_GUILD_ID)
@@ -1107,7 +3839,7 @@ async def sync_commands(interaction: discord.Interaction):
                 description=f"Đã đồng bộ lệnh Slash cho guild test `{test_guild_id_int}`.",
                 color=discord.Color.green()
             )
-            logger.info(f"Slash commands synced to TEST_GUILD_ID: {test_guild_id_int}.")
+            logger.info("Slash commands synced to TEST_GUILD_ID: %s.", test_guild_id_int)
         else:
             await bot.tree.sync()
             embed = discord.Embed(
@@ -1118,7 +3850,7 @@ async def sync_commands(interaction: discord.Interaction):
             logger.info("Slash commands synced globally.")
         await interaction.followup.send(embed=embed, ephemeral=True)
     except Exception as e:
-        logger.error(f"Error syncing commands for {interaction.user.display_name}: {e}")
+        logger.error("Error syncing commands for %s: %s", interaction.user.display_name, e)
         embed = discord.Embed(
             title="❌ Lỗi đồng bộ lệnh!",
             description=f"Đã xảy ra lỗi khi đồng bộ lệnh: `{e}`",
@@ -1129,9 +3861,9 @@ async def sync_commands(interaction: discord.Interaction):
 if __name__ == "__main__":
     if DISCORD_BOT_TOKEN:
         try:
-            bot.run(DISCORD_BOT_TOKEN)
+            bot.run(DISCORD_BOT_TOKEN, log_handler=None)
         except Exception as e:
-            logger.critical(f"Failed to run bot: {e}")
+            logger.critical("Failed to run bot: %s", e)
             print(f"Error: Failed to run bot. Please check your DISCORD_BOT_TOKEN in the .env file. Error: {e}")
     else:
         logger.critical("DISCORD_BOT_TOKEN not found in .env file.")